@@ -1,5 +1,14 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
 import QOTDBot as Qb
-from typing import List
+from datetime import timedelta
+from typing import List, Dict, Iterator
 
 
 class FakeSlackClient:
@@ -29,11 +38,13 @@ class FakeSlackClient:
         return "Dana Foley"
 
     @staticmethod
-    def parse_bot_commands(events: List[dict]):
+    def parse_bot_commands(events: List[dict]) -> Iterator[dict]:
         for event in events:
             if event["type"] == "member_joined_channel" and event["channel"] == Qb.QOTD_CHANNEL:
                 FakeSlackClient.say(Qb.QOTD_CHANNEL,
                                     "Welcome " + fake_get_reference_by_id(event["user"]) + "! " + Qb.WELCOME_MESSAGE)
+            if event["type"] == "message" and "subtype" not in event:
+                yield event
 
 
 def fake_log(response: str):
@@ -51,7 +62,187 @@ def fake_get_id_from_reference(user_id_reference: str):
     return Qb.DEVELOPER_ID
 
 
-if __name__ == "__main__":
+class LoadTestSlackClient(FakeSlackClient):
+    """Counts outbound calls instead of printing them"""
+
+    def __init__(self):
+        self.messages_by_channel: Dict[str, int] = {}
+        self.reactions = 0
+        self.message_bytes = 0
+
+    def say(self, channel: str, response: str):
+        self.messages_by_channel[channel] = self.messages_by_channel.get(channel, 0) + 1
+        self.message_bytes += len(response.encode())
+
+    def react(self, channel: str, timestamp: str, emoji: str):
+        Qb.ignore_unused_args(channel, timestamp, emoji)
+        self.reactions += 1
+
+    def dev_log(self, response: str):
+        # Errors during a load test are worth seeing
+        print(response)
+
+
+# Builds a day's worth of traffic: authors submitting and publishing questions and a poll,
+#   then everyone answering, voting, and checking questions and scores in a shuffled storm
+def generate_trace(num_users: int, num_questions: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    users = ["U%08d" % i for i in range(num_users)]
+    authors = users[:max(1, num_users // 10)]
+    events = []
+
+    def message(user_id: str, text: str, private: bool = True):
+        events.append({"type": "message", "user": user_id, "channel": ("D" + user_id[1:]) if private else Qb.QOTD_CHANNEL,
+                       "text": text, "ts": str(len(events))})
+
+    for i in range(num_questions):
+        message(authors[i % len(authors)], "question q%d What is the answer to number %d? : answer %d : ans%d"
+                % (i, i, i, i))
+    message(authors[0], "poll p1 Which is best? : this one : that one : neither")
+    message(authors[0], "publish-poll p1")
+    for author in authors:
+        message(author, "publish")
+
+    storm_start = len(events)
+    for user_id in users:
+        for i in rng.sample(range(num_questions), min(num_questions, 5)):
+            if rng.random() < 0.5:
+                message(user_id, "answer q%d the answer %d" % (i, i))
+            else:
+                message(user_id, "answer q%d wrong guess" % i)
+        message(user_id, "vote p1 " + str(rng.randint(1, 3)))
+        message(user_id, rng.choice(["questions", "questions-remaining"]))
+        if rng.random() < 0.3:
+            message(user_id, rng.choice(["scores", "scores-unranked", "polls", "old-questions"]), private=False)
+    storm = events[storm_start:]
+    rng.shuffle(storm)
+    events[storm_start:] = storm
+
+    for author in authors:
+        message(author, "my-questions")
+    message(users[-1], "scores", private=False)
+    return events
+
+
+def run_load_test(events: List[dict], use_sqlite: bool = False):
+    # Keep the keepers' files out of the real data
+    os.chdir(tempfile.mkdtemp(prefix="qotd-load-"))
+    with open(Qb.POLLS_FILE_NAME, "w") as polls_file:
+        json.dump({"polls": []}, polls_file)
+
+    Qb.log = fake_log
+    Qb.slack_client = LoadTestSlackClient()
+    storage = Qb.SqliteStorage("qotd.db") if use_sqlite else Qb.FileStorage()
+    Qb.question_keeper = Qb.QuestionKeeper(storage)
+    Qb.score_keeper = Qb.ScoreKeeper(Qb.slack_client, storage)
+    Qb.command_keeper = Qb.CommandKeeper()
+    Qb.poll_keeper = Qb.PollKeeper(storage)
+
+    latencies: Dict[str, List[float]] = {}
+    start = time.perf_counter()
+    for event in Qb.slack_client.parse_bot_commands([dict(event) for event in events]):
+        command_alias = event["text"].split(" ", 1)[0].lower()
+        command_start = time.perf_counter()
+        Qb.command_keeper.handle_event(event)
+        latencies.setdefault(command_alias, []).append(time.perf_counter() - command_start)
+        Qb.flush_due_writers()
+    Qb.flush_all_writers()
+    total_time = time.perf_counter() - start
+
+    print("Replayed %d events in %.2fs (%.0f events/sec), in %s"
+          % (len(events), total_time, len(events) / total_time, os.getcwd()))
+    print("\n%-22s %7s %9s %9s %9s %9s" % ("command", "count", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    for command_alias in sorted(latencies):
+        samples = sorted(latencies[command_alias])
+        print("%-22s %7d %9.3f %9.3f %9.3f %9.3f" % (
+            command_alias, len(samples), Qb.percentile(samples, 0.5) * 1000, Qb.percentile(samples, 0.95) * 1000,
+            Qb.percentile(samples, 0.99) * 1000, samples[-1] * 1000))
+
+    print("\nBytes written to disk:")
+    print("    QuestionKeeper: %d" % Qb.question_keeper.io.bytes_written)
+    print("    ScoreKeeper:    %d" % Qb.score_keeper.io.bytes_written)
+    print("    PollKeeper:     %d" % Qb.poll_keeper.io.bytes_written)
+
+    print("\nOutbound: %d messages (%d bytes), %d reactions"
+          % (sum(Qb.slack_client.messages_by_channel.values()), Qb.slack_client.message_bytes,
+             Qb.slack_client.reactions))
+    for channel, count in sorted(Qb.slack_client.messages_by_channel.items(), key=lambda item: -item[1])[:5]:
+        print("    %s: %d" % (channel, count))
+
+
+# Micro-benchmark for checking guesses: one question with a few accepted answers, and a mix of right and wrong
+#   guesses written the sloppy ways people actually type them
+def run_answer_benchmark(num_guesses: int):
+    q = Qb.Question(Qb.DEVELOPER_ID, "bench", "Name a famous bridge",
+                    ["The Golden Gate Bridge", "golden gate", "Brooklyn Bridge", "the Tower Bridge", "Ponte Vecchio"])
+    guesses = ["golden gate", "The Golden-Gate Bridge!", "  brooklyn bridge ", "Tower bridge?", "ponte vecchio.",
+               "London Bridge", "the bay bridge", "a bridge", "Rialto", "(Sydney) Harbour Bridge"]
+
+    start = time.perf_counter()
+    num_correct = 0
+    for i in range(num_guesses):
+        if q.validate_answer(guesses[i % len(guesses)]):
+            num_correct += 1
+    total_time = time.perf_counter() - start
+
+    print("Checked %d guesses (%d correct) in %.3fs: %.0f guesses/sec, %.2f us each"
+          % (num_guesses, num_correct, total_time, num_guesses / total_time, total_time / num_guesses * 1e6))
+
+
+# Average microseconds per call of func
+def time_calls(func, num_calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(num_calls):
+        func()
+    return (time.perf_counter() - start) / num_calls * 1e6
+
+
+# Benchmark for the score matrix: a ledger of num_days days ending today, with scorers_per_day random users
+#   getting points each day, then how much memory the loaded ScoreKeeper takes and how long `scores` takes
+def run_score_benchmark(num_users: int, num_days: int, scorers_per_day: int, seed: int):
+    rng = random.Random(seed)
+    os.chdir(tempfile.mkdtemp(prefix="qotd-scores-"))
+    storage = Qb.FileStorage()
+
+    users = ["U%08d" % i for i in range(num_users)]
+    events = []
+    for i, user_id in enumerate(users):
+        events.append({"type": "user", "user": user_id, "time": 0})
+        events.append({"type": "name", "user": user_id, "name": "User " + str(i), "time": 0})
+    today = Qb.get_current_date()
+    for day_num in range(num_days):
+        date_string = (today - timedelta(days=num_days - 1 - day_num)).strftime(Qb.DATE_FORMAT)
+        for user_id in rng.sample(users, min(scorers_per_day, num_users)):
+            events.append({"type": "points", "user": user_id, "points": rng.randint(1, 5), "time": 0,
+                           "date": date_string, "reason": "benchmark"})
+    storage.append_score_events(events)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    Qb.score_keeper = Qb.ScoreKeeper(LoadTestSlackClient(), storage)
+    load_time = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    score_keeper = Qb.score_keeper
+    print("%d users x %d days, %d ledger events, in %s" % (num_users, num_days, len(events), os.getcwd()))
+    print("    load from ledger:   %9.2f s (while tracing memory)" % load_time)
+    print("    keeper memory:      %9.1f MB" % (memory / 1e6))
+    print("    scores:             %9.1f us" % time_calls(
+        lambda: score_keeper.get_today_scores_ranked() + score_keeper.get_total_scores_ranked(), 200))
+    print("    scores-unranked:    %9.1f us" % time_calls(
+        lambda: score_keeper.get_today_scores() + score_keeper.get_total_scores(), 200))
+    print("    scores @user:       %9.1f us" % time_calls(lambda: score_keeper.get_user_scores(users[-1]), 2000))
+    year_range = score_keeper.get_date_range("year")
+    print("    scores year:        %9.1f us"
+          % time_calls(lambda: score_keeper.get_range_scores_ranked(*year_range), 200))
+    print("    add a point:        %9.1f us" % time_calls(lambda: score_keeper.add_user_points(users[-1], 1), 2000))
+    print("    monthly totals:     %9.1f us" % time_calls(score_keeper.calculate_monthly_totals, 5))
+    print("    CSV export:         %9.1f us" % time_calls(score_keeper.update_file_with_data, 5))
+    Qb.flush_all_writers()
+
+
+def run_interactive():
     # Overwrite production-based functions
     Qb.log = fake_log
     Qb.get_reference_by_id = fake_get_reference_by_id
@@ -72,15 +263,63 @@ if __name__ == "__main__":
     print("QOTD Bot pretending to be connected and running!")
 
     input_str = ""
-    Qb.slack_client.parse_bot_commands([{
+    for _ in Qb.slack_client.parse_bot_commands([{
         "type": "member_joined_channel",
         "user": "W06GH7XHN",
         "channel": Qb.QOTD_CHANNEL,
         "channel_type": "G",
         "team": "T8MPF7EHL"
-    }])
+    }]):
+        pass
     while input_str != "exit":
         input_str = input("> ")
-        event_to_handle = {"user": Qb.DEVELOPER_ID, "channel": Qb.DEVELOPER_CHANNEL, "text": input_str}
 
-        Qb.command_keeper.handle_event(event_to_handle)
+        # Several commands can be sent at once by separating them with " ;; ",
+        #   to act like a batch of events coming from a single rtm_read
+        events = [{"type": "message", "user": Qb.DEVELOPER_ID, "channel": Qb.DEVELOPER_CHANNEL, "text": text}
+                  for text in input_str.split(" ;; ")]
+
+        for event_to_handle in Qb.slack_client.parse_bot_commands(events):
+            Qb.command_keeper.handle_event(event_to_handle)
+        Qb.run_scheduled_tasks()
+        Qb.flush_due_writers()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run QOTD Bot without Slack")
+    subparsers = parser.add_subparsers(dest="mode")
+    load_parser = subparsers.add_parser("load", help="replay a trace of events as fast as possible and report stats")
+    load_parser.add_argument("--users", type=int, default=100, help="users in a generated trace")
+    load_parser.add_argument("--questions", type=int, default=20, help="questions in a generated trace")
+    load_parser.add_argument("--seed", type=int, default=0, help="random seed for a generated trace")
+    load_parser.add_argument("--trace", help="replay this JSON-lines file of message events instead of generating one")
+    load_parser.add_argument("--record", help="save the generated trace to this file")
+    load_parser.add_argument("--sqlite", action="store_true", help="use SQLite storage instead of the data files")
+    answers_parser = subparsers.add_parser("bench-answers", help="time checking guesses against a question's answers")
+    answers_parser.add_argument("--guesses", type=int, default=500000, help="number of guesses to check")
+    scores_parser = subparsers.add_parser("bench-scores", help="time `scores` and measure memory for a big score sheet")
+    scores_parser.add_argument("--users", type=int, default=1000, help="users with scores")
+    scores_parser.add_argument("--days", type=int, default=3 * 365, help="days of scores, ending today")
+    scores_parser.add_argument("--scorers-per-day", type=int, default=50, help="users getting points each day")
+    scores_parser.add_argument("--seed", type=int, default=0, help="random seed for who scores")
+    args = parser.parse_args()
+
+    if args.mode == "load":
+        if args.trace:
+            with open(args.trace) as trace_file:
+                trace = [json.loads(line) for line in trace_file if line.strip()]
+        else:
+            trace = generate_trace(args.users, args.questions, args.seed)
+        if args.record:
+            with open(args.record, "w") as trace_file:
+                trace_file.writelines([json.dumps(event) + "\n" for event in trace])
+        run_load_test(trace, args.sqlite)
+        sys.exit(0)
+    elif args.mode == "bench-answers":
+        run_answer_benchmark(args.guesses)
+        sys.exit(0)
+    elif args.mode == "bench-scores":
+        run_score_benchmark(args.users, args.days, args.scorers_per_day, args.seed)
+        sys.exit(0)
+
+    run_interactive()
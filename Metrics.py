@@ -0,0 +1,125 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple, Callable, Optional, Union
+
+# Set METRICS_PORT to serve metrics at http://METRICS_HOST:METRICS_PORT/metrics in Prometheus' text format.
+# Left unset, no server is started. Counting still happens either way, since it's cheap
+METRICS_PORT = os.environ.get('METRICS_PORT')
+METRICS_HOST = os.environ.get('METRICS_HOST', "127.0.0.1")
+
+# Label values, as sorted (label name, value) pairs, so they can be dict keys
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """
+    Counters and gauges for the metrics endpoint.
+    Counters are added to as things happen. Values that already live somewhere else, like how many questions
+        are active, are registered as callbacks instead and only read when metrics are requested
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Metric name -> (type, help text)
+        self.descriptions: Dict[str, Tuple[str, str]] = {}
+        # Metric name -> labels -> value
+        self.values: Dict[str, Dict[Labels, float]] = {}
+        # Metric name -> function returning either a value, or a dict of label name -> label value -> value
+        self.callbacks: Dict[str, Callable[[], Union[float, Dict[str, Dict[str, float]]]]] = {}
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        self.descriptions[name] = (metric_type, help_text)
+
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            metric_values = self.values.setdefault(name, {})
+            metric_values[key] = metric_values.get(key, 0) + amount
+
+    def set_callback(self, name: str, metric_type: str, help_text: str,
+                     callback: Callable[[], Union[float, Dict[str, Dict[str, float]]]]):
+        self.describe(name, metric_type, help_text)
+        self.callbacks[name] = callback
+
+    def collect(self) -> Dict[str, Dict[Labels, float]]:
+        with self.lock:
+            collected = {name: dict(metric_values) for name, metric_values in self.values.items()}
+
+        for name, callback in list(self.callbacks.items()):
+            try:
+                result = callback()
+            except Exception as e:
+                print("Couldn't collect metric " + name + ": " + str(e))
+                continue
+            if isinstance(result, dict):
+                collected[name] = {((label_name, label_value),): value
+                                   for label_name, values in result.items()
+                                   for label_value, value in values.items()}
+            else:
+                collected[name] = {(): result}
+        return collected
+
+    def render(self) -> str:
+        lines = []
+        for name, metric_values in sorted(self.collect().items()):
+            if name in self.descriptions:
+                metric_type, help_text = self.descriptions[name]
+                lines.append("# HELP " + name + " " + help_text)
+                lines.append("# TYPE " + name + " " + metric_type)
+            for labels, value in sorted(metric_values.items()):
+                lines.append(name + format_labels(labels) + " " + format_value(value))
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = [label_name + '="' + str(label_value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+               + '"' for label_name, label_value in labels]
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# The one registry everything reports to
+metrics = MetricsRegistry()
+
+metrics.describe("qotd_events_received_total", "counter", "Events read from the Slack RTM API, by event type")
+metrics.describe("qotd_commands_total", "counter", "Commands dispatched, by the alias they were called with")
+metrics.describe("qotd_api_calls_total", "counter", "Slack Web API requests made, by method, including retries")
+metrics.describe("qotd_rate_limit_sleep_seconds_total", "counter",
+                 "Seconds spent waiting on our own rate limiter, by method")
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+
+        body = metrics.render().encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Scrapes would otherwise print a line to stderr every time
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: Optional[str] = METRICS_PORT, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    if not port:
+        return None
+
+    server = ThreadingHTTPServer((host, int(port)), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print("Serving metrics on http://" + host + ":" + str(port) + "/metrics")
+    return server
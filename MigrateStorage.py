@@ -0,0 +1,71 @@
+import os
+import sys
+import argparse
+
+from Storage import FileStorage, SqliteStorage
+from ScoreKeeper import ScoreKeeper
+
+# One-shot copy of everything in the data files in the current directory into a new SQLite database.
+# Older formats (questionsHistory.json, a scores.csv with no ledger) are read the same way the bot would read them.
+# The files are left in place, so going back is just a matter of unsetting QOTD_DATABASE
+
+
+def migrate_files_to_sqlite(database_file_name: str):
+    if os.path.exists(database_file_name):
+        existing_storage = SqliteStorage(database_file_name)
+        has_data = existing_storage.has_data()
+        existing_storage.close()
+        if has_data:
+            raise ValueError(database_file_name + " already has data in it")
+
+    # Everything goes into a separate file that only takes the database's name once it's all there,
+    #   so a failure partway through doesn't leave a half-migrated database in the way of trying again
+    temp_file_name = database_file_name + ".migrating"
+    remove_database_files(temp_file_name)
+    file_storage = FileStorage()
+    sqlite_storage = SqliteStorage(temp_file_name)
+    try:
+        questions = file_storage.load_questions()
+        sqlite_storage.write_question_snapshot(questions)
+
+        # History is read newest first, and appended oldest first
+        old_questions = list(reversed(file_storage.read_history()))
+        sqlite_storage.append_to_history(old_questions)
+
+        score_events = file_storage.load_score_events()
+        if score_events is None:
+            score_events = ScoreKeeper.get_events_from_score_sheet()
+        sqlite_storage.append_score_events(score_events)
+
+        polls = file_storage.load_polls()
+        sqlite_storage.save_polls(polls)
+    except Exception:
+        sqlite_storage.close()
+        remove_database_files(temp_file_name)
+        raise
+    sqlite_storage.close()
+
+    # Clears out the empty database along with any -wal or -shm it left, which SQLite would read as part of the new one
+    remove_database_files(database_file_name)
+    os.replace(temp_file_name, database_file_name)
+
+    print("Migrated %d questions, %d old questions, %d score events and %d polls into %s"
+          % (len(questions), len(old_questions), len(score_events), len(polls), database_file_name))
+
+
+def remove_database_files(database_file_name: str):
+    for file_name in [database_file_name, database_file_name + "-wal", database_file_name + "-shm"]:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy QOTD Bot's data files into a SQLite database")
+    parser.add_argument("database", help="database file to create, e.g. qotd.db")
+    args = parser.parse_args()
+
+    try:
+        migrate_files_to_sqlite(args.database)
+    except ValueError as e:
+        print(str(e))
+        sys.exit(1)
@@ -0,0 +1,82 @@
+import os
+import time
+import atexit
+import weakref
+from typing import Callable, IO, List, Optional
+
+# Changes are written out at most this many seconds after they're made, so a burst of changes costs one write
+PERSIST_COALESCE_WINDOW = 1.0
+
+
+# Writes a file so that a crash leaves either the old contents or the new, never a mix.
+# The new contents go to a temp file next to the real one, which replaces it only once it's safely on disk.
+# Returns the number of bytes written
+def atomic_write(file_name: str, write: Callable[[IO], None], newline: Optional[str] = None) -> int:
+    temp_file_name = file_name + ".tmp"
+    with open(temp_file_name, 'w', newline=newline) as temp_file:
+        write(temp_file)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_file_name, file_name)
+    return os.path.getsize(file_name)
+
+
+# Appends lines to a file and makes sure they're on disk before returning. Returns the number of bytes written
+def durable_append(file_name: str, lines: List[str]) -> int:
+    with open(file_name, 'a') as file:
+        file.writelines(lines)
+        file.flush()
+        os.fsync(file.fileno())
+    return sum([len(line.encode()) for line in lines])
+
+
+class DebouncedWriter:
+    """
+    Runs a write function once for any number of changes, no sooner than `window` seconds after the first change.
+    Keepers mark their writer dirty whenever something changes, and the main loop calls flush_due_writers()
+    """
+
+    def __init__(self, write: Callable[[], None], window: float = PERSIST_COALESCE_WINDOW):
+        self.write = write
+        self.window = window
+        self.dirty_since: Optional[float] = None
+        all_writers.add(self)
+
+    def mark_dirty(self):
+        if self.dirty_since is None:
+            self.dirty_since = time.time()
+
+    def is_due(self, now: float) -> bool:
+        return self.dirty_since is not None and now - self.dirty_since >= self.window
+
+    def flush(self):
+        if self.dirty_since is None:
+            return
+        dirty_since = self.dirty_since
+        self.dirty_since = None
+        try:
+            self.write()
+        except Exception:
+            # Still dirty, so the write gets tried again on the next flush
+            self.dirty_since = dirty_since
+            raise
+
+
+# Every writer that hasn't been garbage collected along with its keeper
+all_writers: 'weakref.WeakSet[DebouncedWriter]' = weakref.WeakSet()
+
+
+def flush_due_writers():
+    now = time.time()
+    for writer in list(all_writers):
+        if writer.is_due(now):
+            writer.flush()
+
+
+# Writes out everything that's pending, due or not. Run on shutdown
+def flush_all_writers():
+    for writer in list(all_writers):
+        writer.flush()
+
+
+atexit.register(flush_all_writers)
@@ -1,8 +1,8 @@
-import json
-import shutil
 from typing import List, Dict, Optional
 
-POLLS_FILE_NAME = "polls.json"
+from Utils import IOCounter, ResponseCache, timed_io
+from Persistence import DebouncedWriter
+from Storage import Storage, FileStorage
 
 
 class PollQuestion:
@@ -73,33 +73,50 @@ class PollQuestion:
             self.just_published = True
             return True
 
+    def to_json(self) -> dict:
+        return {
+            "user_id": self.user_id,
+            "pID": self.p_id,
+            "pollQuestionText": self.poll_question_text,
+            "options": self.options,
+            "responses": self.responses,
+            "published": self.published,
+            "justPublished": self.just_published
+        }
+
+    @staticmethod
+    def from_json(p_json: dict) -> 'PollQuestion':
+        # Polls used to be saved with their attribute names as keys, so those are accepted too
+        p = PollQuestion(p_json["user_id"], p_json.get("pID", p_json.get("p_id")),
+                         p_json.get("pollQuestionText", p_json.get("poll_question_text")),
+                         p_json["options"], p_json["responses"])
+        p.published = p_json["published"]
+        p.just_published = p_json.get("justPublished", p_json.get("just_published", False))
+        return p
+
 
 class PollKeeper:
-    def __init__(self):
+    def __init__(self, storage: Optional[Storage] = None):
+        self.storage: Storage = storage if storage else FileStorage()
         self.poll_question_list: List[PollQuestion] = []
+        self.io = IOCounter()
+        self.polls_writer = DebouncedWriter(self.write_polls_to_file)
+        # Every change to the polls gets saved, so save_polls is where it's invalidated
+        self.response_cache = ResponseCache()
         self.load_polls_from_file()
 
     def load_polls_from_file(self):
-        with open(POLLS_FILE_NAME) as pFile:
-            d = json.load(pFile)
-            for p_json in d["polls"]:
-                p = PollQuestion(p_json["user_id"], p_json["pID"], p_json["pollQuestionText"], p_json["options"],
-                                 p_json["responses"])
-                p.published = p_json["published"]
-                p.just_published = p_json["justPublished"]
-
-                self.poll_question_list.append(p)
+        for p_json in self.storage.load_polls():
+            self.poll_question_list.append(PollQuestion.from_json(p_json))
 
+    @timed_io
     def write_polls_to_file(self):
-        polls_json = {"polls": []}
+        self.io.bytes_written += self.storage.save_polls([p.to_json() for p in self.poll_question_list])
 
-        for p in self.poll_question_list:
-            polls_json["polls"].append(vars(p))
-
-        with open(POLLS_FILE_NAME, 'w') as tempfile:
-            json.dump(polls_json, tempfile, indent=4)
-
-        shutil.move(tempfile.name, POLLS_FILE_NAME)
+    # Polls are saved a moment after they change, so a burst of votes only rewrites the file once
+    def save_polls(self):
+        self.response_cache.invalidate()
+        self.polls_writer.mark_dirty()
 
     def add_poll(self, user_id: str, p_id: str, poll_question_text: str,
                  options: Dict[str, str]=None, responses: Dict[str, str]=None) -> bool:
@@ -115,7 +132,7 @@ class PollKeeper:
         self.poll_question_list.append(PollQuestion(user_id, p_id, poll_question_text, options, responses))
 
         # save new data
-        self.write_polls_to_file()
+        self.save_polls()
         return True
 
     def remove_poll(self, p_id: str, user_id: str) -> bool:
@@ -125,7 +142,7 @@ class PollKeeper:
                 self.poll_question_list.remove(p)
 
                 # save new data
-                self.write_polls_to_file()
+                self.save_polls()
                 return True
         return False
 
@@ -147,7 +164,7 @@ class PollKeeper:
         p = self.get_poll_by_id(p_id)
         if p and p.published:
             if p.submit_response(user_id, input_response):
-                self.write_polls_to_file()
+                self.save_polls()
                 return "ok"
             else:
                 return "bad vote"
@@ -182,8 +199,10 @@ class PollKeeper:
                 if p.user_id == user_id:
                     polls_expired.append(p)
 
-        self.poll_question_list: List[PollQuestion] = [p for p in self.poll_question_list if p not in polls_expired]
-        self.write_polls_to_file()
+        if polls_expired:
+            self.poll_question_list: List[PollQuestion] = [p for p in self.poll_question_list
+                                                           if p not in polls_expired]
+            self.save_polls()
 
         return polls_expired
 
@@ -191,7 +210,7 @@ class PollKeeper:
         p = self.get_poll_by_id(p_id)
         if p:
             if p.publish():
-                self.write_polls_to_file()
+                self.save_polls()
                 return "published"
             else:
                 return "already published"
@@ -199,18 +218,22 @@ class PollKeeper:
             return "notFound"
 
     def publish_all_by_user(self, user_id: str):
+        published_any = False
         for p in self.poll_question_list:
-            if p.user_id == user_id:
-                p.publish()
-        self.write_polls_to_file()
+            if p.user_id == user_id and p.publish():
+                published_any = True
+        if published_any:
+            self.save_polls()
 
     def first_time_display(self) -> str:
         output = ""
         for p in self.poll_question_list:
-            if p.justPublished:
-                p.justPublished = False
+            if p.just_published:
+                p.just_published = False
                 output += p.pretty_print() + "\n\n"
-        self.write_polls_to_file()
+        # Only saves if there was something to display, since a publish that did nothing still ends up here
+        if output:
+            self.save_polls()
         return output
 
     def display_results(self, p_id: str) -> Optional[str]:
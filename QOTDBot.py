@@ -1,5 +1,10 @@
+import re
+import sys
+import atexit
 import random
+import signal
 import traceback
+from datetime import datetime, timedelta
 
 from WellBehavedSlackClient import *
 
@@ -8,6 +13,9 @@ from ScoreKeeper import *
 from PollKeeper import *
 
 from Utils import *
+from Metrics import *
+from Persistence import *
+from Storage import *
 
 # Make keeper objects global. They are initialized in main
 slack_client = None
@@ -19,6 +27,15 @@ poll_keeper = None
 # Add more responses here to be randomly picked
 POINT_RESPONSES = ["Correct! I'll give you a point", ":thumbsup:", "Correct! :fast_parrot:"]
 
+# Which questions count as expired "in the last 24 hours" changes with time, not just with the questions.
+# So `old-questions` responses are only reused within windows of this many seconds
+OLD_QUESTIONS_CACHE_SECONDS = 60
+
+# The parts of handling a command that get timed separately, for `stats`.
+# "io" only covers writes made while the command runs. Most changes are saved afterwards by save_due_changes,
+#   which is timed on its own
+TIMING_PHASES = ["total", "parse", "handler", "io", "api"]
+
 
 def get_name_by_id(user_id: str) -> str:
     # All Slack user IDs start with "U" or "W", by convention
@@ -37,6 +54,16 @@ def get_name_by_id(user_id: str) -> str:
     return slack_client.get_name_by_id(user_id)
 
 
+# Total time the keepers have spent writing files
+def get_io_seconds() -> float:
+    return sum([keeper.io.seconds for keeper in [question_keeper, score_keeper, poll_keeper] if keeper])
+
+
+# Total time command handling has spent waiting on Slack
+def get_api_seconds() -> float:
+    return getattr(slack_client, "foreground_api_seconds", 0.0)
+
+
 def needs_more_args(channel: str):
     slack_client.say(channel, "This command needs more arguments! Type \"(command) help\" for usage")
 
@@ -45,11 +72,22 @@ def scores(channel: str, user_id: str, args_string: str, timestamp: str):
     """
     Print a list of today's scores, and running monthly scores
     Ranked by number of points
+    Given a date range instead, print everyone's scores from it
     """
     ignore_unused_args(user_id, timestamp)
 
     args = args_string.split(' ', 1)
 
+    # If a date range is specified, like `scores week` or `scores 9/1/2026..9/15/2026`
+    date_range = score_keeper.get_date_range(args[0]) if args[0] != "" else None
+    if date_range:
+        start, end, description = date_range
+        response = score_keeper.response_cache.get(
+            "scores-range", lambda: score_keeper.get_range_scores_ranked(start, end, description),
+            start, end, description)
+        slack_client.say(channel, response)
+        return
+
     # If a user to get scores for is specified
     if len(args) > 0 and args[0] != "":
         scores_for_user = get_id_from_reference(args[0])
@@ -63,8 +101,8 @@ def scores(channel: str, user_id: str, args_string: str, timestamp: str):
         return
 
     # Otherwise, print scores for everyone
-    response = score_keeper.get_today_scores_ranked()
-    response += score_keeper.get_total_scores_ranked()
+    response = score_keeper.response_cache.get(
+        "scores", lambda: score_keeper.get_today_scores_ranked() + score_keeper.get_total_scores_ranked())
     slack_client.say(channel, response)
 
 
@@ -75,8 +113,8 @@ def scores_unranked(channel: str, user_id: str, args_string: str, timestamp: str
     """
     ignore_unused_args(user_id, args_string, timestamp)
 
-    response = score_keeper.get_today_scores()
-    response += score_keeper.get_total_scores()
+    response = score_keeper.response_cache.get(
+        "scores-unranked", lambda: score_keeper.get_today_scores() + score_keeper.get_total_scores())
     slack_client.say(channel, response)
 
 
@@ -161,7 +199,7 @@ def question(channel: str, user_id: str, args_string: str, timestamp: str):
         if (num_guesses - num_answers) > 0:
             response += ":\n"
             response += "\n".join(
-                [("-" + get_name_by_id(guessedID)) for guessedID in q.guesses.keys() if guessedID not in q.answered_by])
+                [("-" + get_name_by_id(guessedID)) for guessedID in q.guesses.keys() if not q.has_answered(guessedID)])
 
         slack_client.say(channel, response)
         return
@@ -333,15 +371,22 @@ def questions(channel: str, user_id: str, args_string: str, timestamp: str):
     """
     ignore_unused_args(args_string, timestamp)
 
-    if is_channel_private(channel):
-        response = question_keeper.list_questions_private(user_id)
-    else:
-        response = question_keeper.list_questions()
+    def render_questions() -> str:
+        if is_channel_private(channel):
+            questions_list = question_keeper.list_questions_private(user_id)
+        else:
+            questions_list = question_keeper.list_questions()
 
-    if response == "":
-        response = "There are no currently active questions"
+        if questions_list == "":
+            return "There are no currently active questions"
+        else:
+            return "Here are all the currently active questions:\n" + questions_list
+
+    # Only private listings are personalized
+    if is_channel_private(channel):
+        response = question_keeper.response_cache.get("questions", render_questions, True, user_id)
     else:
-        response = "Here are all the currently active questions:\n" + response
+        response = question_keeper.response_cache.get("questions", render_questions, False)
 
     slack_client.say(channel, response)
 
@@ -396,15 +441,86 @@ def my_questions(channel: str, user_id: str, args_string: str, timestamp: str):
     slack_client.say(channel, response)
 
 
+# Parses when to publish: "at 9:30" or "at 2pm" means the next time it's that time of day,
+#   and "in 30m", "in 2 hours" or "in 1d" means that long from now.
+# Returns None if it can't make sense of it
+def parse_publish_time(time_spec: str) -> Optional[float]:
+    words = time_spec.lower().split(' ', 1)
+    if len(words) < 2:
+        return None
+    when = words[1].replace(" ", "")
+
+    if words[0] == "in":
+        matches = re.fullmatch(r"(\d+(?:\.\d+)?)(m|mins?|minutes?|h|hrs?|hours?|d|days?)", when)
+        if not matches:
+            return None
+        seconds_per_unit = {"m": 60, "h": 60 * 60, "d": 60 * 60 * 24}[matches.group(2)[0]]
+        return time.time() + float(matches.group(1)) * seconds_per_unit
+
+    if words[0] == "at":
+        matches = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?(am|pm)?", when)
+        if not matches:
+            return None
+        hour, minute = int(matches.group(1)), int(matches.group(2) or 0)
+        if matches.group(3):
+            if not 1 <= hour <= 12:
+                return None
+            hour = hour % 12 + (12 if matches.group(3) == "pm" else 0)
+        if hour > 23 or minute > 59:
+            return None
+
+        now = datetime.now()
+        publish_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if publish_time <= now:
+            publish_time += timedelta(days=1)
+        return publish_time.timestamp()
+
+    return None
+
+
 def publish(channel: str, user_id: str, args_string: str, timestamp: str):
     """
     Publish all questions by a user.
-    If question ID given as argument, publish only that question
+    If question ID given as argument, publish only that question.
+    Either way, "at [time]" or "in [amount of time]" at the end publishes later instead of now
     """
     ignore_unused_args(timestamp)
 
-    args = args_string.split(' ', 1)
-    identifier = args[0] if len(args) > 0 else ""
+    args = args_string.split(' ')
+    identifier = args[0]
+    time_spec = ""
+    if identifier in ["at", "in"]:
+        identifier = ""
+        time_spec = args_string
+    elif len(args) > 1 and args[1] in ["at", "in"]:
+        time_spec = " ".join(args[1:])
+
+    if time_spec != "":
+        publish_time = parse_publish_time(time_spec)
+        if publish_time is None:
+            slack_client.say(channel, "I couldn't tell when you want to publish. "
+                                      "Try something like `at 9:30`, `at 2pm`, or `in 3 hours`")
+            return
+
+        when = format_publish_time(publish_time)
+        if identifier != "":
+            schedule_response = question_keeper.schedule_publish_by_id(identifier, publish_time)
+            if schedule_response == "scheduled":
+                response = "Okay, I'll publish question " + identifier + " on " + when + ".\n"
+            elif schedule_response == "already published":
+                response = identifier + " is already published.\n"
+            else:
+                response = "I couldn't find a question with that ID.\n"
+        else:
+            num_scheduled = question_keeper.schedule_publish_all_by_user(user_id, publish_time)
+            if num_scheduled > 0:
+                response = "Okay, I'll publish your " + str(num_scheduled) + " unpublished question" \
+                           + ("s" if num_scheduled != 1 else "") + " on " + when + ".\n"
+            else:
+                response = "You don't have any unpublished questions.\n"
+
+        slack_client.say(channel, response)
+        return
 
     if identifier != "":
         publish_response = question_keeper.publish_by_id(identifier)
@@ -451,7 +567,7 @@ def answer(channel: str, user_id: str, args_string: str, timestamp: str):
             score_keeper.add_new_user(user_id)
             score_keeper.add_name_to_user(user_id, get_name_by_id(user_id))
 
-        score_keeper.add_user_point(user_id)
+        score_keeper.add_user_point(user_id, "answered " + q_id)
         slack_client.say(POINT_ANNOUNCEMENT_CHANNEL, "Point for " + get_name_by_id(user_id) +
                          ((" on question " + q_id + "!") if q_id != "" else "!")
                          + ("\nThough they are the one who submitted it :wha:..."
@@ -529,7 +645,7 @@ def approve(channel: str, user_id: str, args_string: str, timestamp: str):
         score_keeper.add_new_user(referenced_user_id)
         score_keeper.add_name_to_user(referenced_user_id, get_name_by_id(referenced_user_id))
 
-    score_keeper.add_user_point(referenced_user_id)
+    score_keeper.add_user_point(referenced_user_id, "approved on " + q.q_id)
 
     slack_client.say(POINT_ANNOUNCEMENT_CHANNEL,
                      "Point for " + get_name_by_id(referenced_user_id) +
@@ -546,12 +662,17 @@ def old_questions(channel: str, user_id: str, args_string: str, timestamp: str):
     """
     ignore_unused_args(user_id, args_string, timestamp)
 
-    response = question_keeper.get_old_questions_string()
+    def render_old_questions() -> str:
+        old_questions_list = question_keeper.get_old_questions_string()
 
-    if response != "":
-        response = "Here are all of the questions I found that were expired in the last 24 hours:\n\n" + response
-    else:
-        response = "I couldn't find any questions that were expired in the last 24 hours"
+        if old_questions_list != "":
+            return "Here are all of the questions I found that were expired in the last 24 hours:\n\n" \
+                   + old_questions_list
+        else:
+            return "I couldn't find any questions that were expired in the last 24 hours"
+
+    response = question_keeper.response_cache.get("old-questions", render_old_questions,
+                                                   int(time.time() // OLD_QUESTIONS_CACHE_SECONDS))
     slack_client.say(channel, response)
 
 
@@ -618,22 +739,15 @@ def add_points(channel: str, user_id: str, args_string: str, timestamp: str):
         score_keeper.add_name_to_user(user_id, get_name_by_id(user_id))
 
     num_points_digits_only = int(num_points_digits_only)
-    score_keeper.add_user_points(points_for_user, num_points_digits_only)
+    score_keeper.add_user_points(points_for_user, num_points_digits_only, "add-points by " + user_id)
 
     response = "Okay, I gave " + str(num_points_digits_only) + " point" + (
         "s" if num_points_digits_only != 1 else "") + " to " + get_name_by_id(points_for_user)
     slack_client.say(DEPLOY_CHANNEL, response)
 
 
-def expire_old_questions(channel: str, user_id: str, args_string: str, timestamp: str):
-    """
-    Expire all questions of yours older than 18 hours.
-    Posts the expired questions, their answers,
-        and a list of users who answered correctly, to the deploy channel.
-    """
-    ignore_unused_args(args_string, timestamp)
-
-    expired_questions = question_keeper.expire_questions(user_id)
+# Lists expired questions, their answers, and who answered them
+def get_expired_questions_string(expired_questions: List[Question]) -> str:
     expired_questions_strings = []
     for q in expired_questions:
         expired_questions_strings.append(q.pretty_print_with_answer())
@@ -643,17 +757,57 @@ def expire_old_questions(channel: str, user_id: str, args_string: str, timestamp
             expired_questions_strings.append("        -" + get_name_by_id(answered_user_id))
         expired_questions_strings.append("\n")
 
+    return "The following questions have expired:\n" + '\n'.join(expired_questions_strings)
+
+
+def expire_old_questions(channel: str, user_id: str, args_string: str, timestamp: str):
+    """
+    Expire all questions of yours published longer ago than QUESTION_LIFETIME_HOURS.
+    Posts the expired questions, their answers,
+        and a list of users who answered correctly, to the deploy channel.
+    """
+    ignore_unused_args(args_string, timestamp)
+
+    expired_questions = question_keeper.expire_questions(user_id)
+
     if len(expired_questions) > 0:
-        response = "The following questions have expired:\n"
-        response += '\n'.join(expired_questions_strings)
+        response = get_expired_questions_string(expired_questions)
         if channel != DEPLOY_CHANNEL:
             slack_client.say(DEPLOY_CHANNEL, response)
     else:
-        response = "No questions of yours older than 18 hours were found"
+        response = "No questions of yours older than %g hours were found" % QUESTION_LIFETIME_HOURS
 
     slack_client.say(channel, response)
 
 
+# Called every time around the main loop. Anything here should be cheap when there's nothing to do
+def run_scheduled_tasks():
+    # Questions scheduled with `publish ... at/in ...` that are due all go out in one announcement
+    published_questions = question_keeper.publish_due_questions()
+    if published_questions:
+        slack_client.say(DEPLOY_CHANNEL,
+                         "New questions:\n" + "".join([q.pretty_print() + "\n" for q in published_questions]))
+
+    # Questions expire on their own once they've been up for QUESTION_LIFETIME_HOURS,
+    #   with everything that expired at once announced together
+    expired_questions = question_keeper.expire_due_questions()
+    if expired_questions:
+        slack_client.say(DEPLOY_CHANNEL, get_expired_questions_string(expired_questions))
+
+    # A new day of scores starts at midnight in QOTD_TIMEZONE
+    score_keeper.roll_over_if_due()
+
+
+# Changes get written out a moment after they're made, so several changes share a write.
+# Called every time around the main loop, and only times the loops where something actually got written
+def save_due_changes():
+    io_seconds_before = get_io_seconds()
+    flush_due_writers()
+    io_seconds = get_io_seconds() - io_seconds_before
+    if io_seconds > 0:
+        command_keeper.save_timings.add(io_seconds)
+
+
 def poll(channel: str, user_id: str, args_string: str, timestamp: str):
     """
     Create or modify a poll, with poll text and options separated by " : "
@@ -722,13 +876,15 @@ def polls(channel: str, user_id: str, args_string: str, timestamp: str):
     """
     ignore_unused_args(user_id, args_string, timestamp)
 
-    response = poll_keeper.list_polls()
+    def render_polls() -> str:
+        polls_list = poll_keeper.list_polls()
 
-    if response == "":
-        response = "There are no currently active polls"
-    else:
-        response = "Here are all the currently active polls:\n" + response
+        if polls_list == "":
+            return "There are no currently active polls"
+        else:
+            return "Here are all the currently active polls:\n" + polls_list
 
+    response = poll_keeper.response_cache.get("polls", render_polls)
     slack_client.say(channel, response)
 
 
@@ -853,21 +1009,34 @@ def refresh_user_list(channel: str, user_id: str, args_string: str, timestamp: s
     """
     Update the user list that caches user name info
     """
-    ignore_unused_args(channel, user_id, args_string, timestamp)
+    ignore_unused_args(user_id, args_string, timestamp)
 
     users_json = {}
 
-    users_list = slack_client.api_call("users.list")["members"]
-    for member in users_list:
+    users_response = slack_client.api_call("users.list")
+    if not users_response.get("ok"):
+        slack_client.say(channel, "I couldn't get the user list from Slack (" + str(users_response.get("error"))
+                         + "), so I'm sticking with the one I had")
+        return
+
+    for member in users_response["members"]:
         name = member["profile"]["display_name"]
         if name == "":
             name = member["profile"]["real_name"]
         users_json[member["id"]] = name
 
-    with open(USER_LIST_FILE, 'w') as tempfile:
-        json.dump(users_json, tempfile, indent=4)
+    atomic_write(USER_LIST_FILE, lambda users_file: json.dump(users_json, users_file, indent=4))
+
+    slack_client.set_user_names(users_json)
+
+
+def stats(channel: str, user_id: str, args_string: str, timestamp: str):
+    """
+    Show how long each command has been taking since startup
+    """
+    ignore_unused_args(user_id, args_string, timestamp)
 
-    shutil.move(tempfile.name, USER_LIST_FILE)
+    slack_client.say(channel, command_keeper.get_stats_string())
 
 
 def backup_data(channel: str, user_id: str, args_string: str, timestamp: str):
@@ -909,7 +1078,9 @@ class CommandKeeper:
                 func=scores,
                 category="Scoring and Points",
                 help_text="`scores <@ user>` - prints a list of today's scores and running totals, for `<@ user>` if "
-                          "given, for everyone otherwise "
+                          "given, for everyone otherwise.\n"
+                          "`scores <range>` - prints everyone's scores from `week`, `month`, `last-month`, `year`, "
+                          "`all` (time), or between two dates like `9/1/2026..9/15/2026`"
             ),
 
             Command(
@@ -993,8 +1164,9 @@ class CommandKeeper:
                 aliases=["publish"],
                 func=publish,
                 category="Questions and Answers",
-                help_text="`publish <identifier>` - publishes the corresponding question if `identifier` given. "
-                          + "Publishes all of your questions otherwise."
+                help_text="`publish <identifier> <at [time] | in [amount of time]>` - publishes the corresponding "
+                          + "question if `identifier` given. Publishes all of your questions otherwise. "
+                          + "Add e.g. `at 9:30` or `in 2 hours` to publish later instead of now"
             ),
 
             Command(
@@ -1039,7 +1211,8 @@ class CommandKeeper:
                 aliases=["expire-old-questions"],
                 func=expire_old_questions,
                 category="Questions and Answers",
-                help_text="`expire-old-questions` - removes all questions published more than 18 hours ago"
+                help_text="`expire-old-questions` - removes all questions published more than %g hours ago. "
+                          "This also happens automatically" % QUESTION_LIFETIME_HOURS
             ),
 
             Command(
@@ -1107,6 +1280,12 @@ class CommandKeeper:
                 aliases=["backup-data"],
                 func=backup_data,
                 dev_only=True
+            ),
+
+            Command(
+                aliases=["stats"],
+                func=stats,
+                dev_only=True
             )
         ]
 
@@ -1123,29 +1302,75 @@ class CommandKeeper:
         for category in self.help_text_dict.keys():
             self.help_text_dict[category].sort()
 
-    def help(self, channel: str):
-        response = ""
-
+        # The full help text never changes, so it only gets put together once
+        help_sections = []
         for category in self.help_text_dict:
-            response += "*" + category + "*:\n"
-            for help_text in self.help_text_dict[category]:
-                for line in help_text.split("\n"):
-                    response += "    " + line + "\n\n"
-            response += "\n\n"
-        response = response[:-2]  # Slice off the last two newlines
+            lines = [line for help_text in self.help_text_dict[category] for line in help_text.split("\n")]
+            help_sections.append("*" + category + "*:\n" + "".join(["    " + line + "\n\n" for line in lines]))
+        self.help_response = "Here's a list of commands I know:\n\n" + "\n\n".join(help_sections)
+
+        # Command alias -> timing phase -> recent timings, in seconds
+        self.command_timings: Dict[str, Dict[str, RollingHistogram]] = {}
+        # Recent times taken by save_due_changes to write out changes, in seconds
+        self.save_timings = RollingHistogram()
+        self.start_time = time.time()
+
+        # Look up commands by alias. Two commands sharing an alias would make one of them unreachable
+        self.commands_by_alias: Dict[str, Command] = {}
+        for command in self.commands_list:
+            for alias in command.aliases:
+                if alias in self.commands_by_alias:
+                    raise ValueError("The alias \"" + alias + "\" is used by more than one command")
+                self.commands_by_alias[alias] = command
 
-        slack_client.say(channel, "Here's a list of commands I know:\n\n" + response)
+    def help(self, channel: str):
+        slack_client.say(channel, self.help_response)
 
     def get_command_by_alias(self, alias: str) -> Optional[Command]:
-        for cmd in self.commands_list:
-            if alias in cmd.aliases:
-                return cmd
-        return None
+        return self.commands_by_alias.get(alias)
+
+    def record_timings(self, command_alias: str, timings: Dict[str, float]):
+        if command_alias not in self.command_timings:
+            self.command_timings[command_alias] = {phase: RollingHistogram() for phase in TIMING_PHASES}
+        for phase, seconds in timings.items():
+            self.command_timings[command_alias][phase].add(seconds)
+
+    def get_stats_string(self) -> str:
+        uptime_hours = (time.time() - self.start_time) / (60 * 60)
+        response = "Command timings from the last %.1f hours, as p50 / p95 / p99 in ms:\n" % uptime_hours
+
+        by_count = sorted(self.command_timings.items(), key=lambda item: -item[1]["total"].count)
+        for command_alias, histograms in by_count:
+            response += "`" + command_alias + "` - " + str(histograms["total"].count) + " calls\n"
+            phase_strings = []
+            for phase in TIMING_PHASES:
+                percentiles = histograms[phase].percentiles([0.5, 0.95, 0.99])
+                phase_strings.append(phase + " " + " / ".join(["%.2f" % (percentiles[fraction] * 1000)
+                                                               for fraction in [0.5, 0.95, 0.99]]))
+            response += "    " + ", ".join(phase_strings) + "\n"
+
+        if not self.command_timings:
+            response += "No commands yet\n"
+
+        save_percentiles = self.save_timings.percentiles([0.5, 0.95, 0.99])
+        response += "\nSaving changes: %d writes, p50 / p95 / p99 in ms: %s\n" % (
+            self.save_timings.count, " / ".join(["%.2f" % (save_percentiles[fraction] * 1000)
+                                                 for fraction in [0.5, 0.95, 0.99]]))
+
+        if hasattr(slack_client, "get_outbound_stats"):
+            outbound_stats = slack_client.get_outbound_stats()
+            response += "\nOutbound queue: %d waiting, %d sent, latency p50 / p95 / p99 / max in ms: %s" % (
+                outbound_stats["queue_depth"], outbound_stats["sent"],
+                " / ".join(["%.2f" % (latency * 1000)
+                            for latency in get_outbound_latencies(outbound_stats).values()]))
+        return response
 
     def handle_event(self, event):
         """
         Execute bot command if the command is known
         """
+        start = time.perf_counter()
+
         user_id = event["user"]
         channel = event["channel"]
         if "ts" in event:
@@ -1193,6 +1418,10 @@ class CommandKeeper:
             return
 
         # If we make it through all the checks, we can actually run the corresponding function
+        metrics.inc("qotd_commands_total", alias=command_alias)
+        handler_start = time.perf_counter()
+        io_seconds_before = get_io_seconds()
+        api_seconds_before = get_api_seconds()
         try:
             cmd.func(channel, user_id, args, timestamp)
         except Exception as e:
@@ -1201,6 +1430,87 @@ class CommandKeeper:
                     "text"] + "\nAnd the following error ocurred:\n\n" + str(
                     e) + "\n\n" + traceback.format_exc())
 
+        end = time.perf_counter()
+        io_seconds = get_io_seconds() - io_seconds_before
+        api_seconds = get_api_seconds() - api_seconds_before
+        self.record_timings(command_alias, {
+            "total": end - start,
+            "parse": handler_start - start,
+            "handler": (end - handler_start) - io_seconds - api_seconds,
+            "io": io_seconds,
+            "api": api_seconds
+        })
+
+
+# Values the metrics endpoint reads straight from the keepers and client whenever it's scraped
+def register_metrics_callbacks():
+    metrics.set_callback(
+        "qotd_file_bytes_written_total", "counter", "Bytes written to data files and journals, by keeper",
+        lambda: get_by_keeper(lambda keeper: keeper.io.bytes_written))
+    metrics.set_callback(
+        "qotd_active_questions", "gauge", "Questions that haven't expired yet, by whether they're published",
+        lambda: {"state": count_by_published(list(question_keeper.questions_by_id.values()))})
+    metrics.set_callback(
+        "qotd_active_polls", "gauge", "Polls that haven't expired yet, by whether they're published",
+        lambda: {"state": count_by_published(poll_keeper.poll_question_list)})
+    metrics.set_callback(
+        "qotd_outbound_queue_depth", "gauge", "Messages and reactions waiting to be sent",
+        lambda: slack_client.get_outbound_stats()["queue_depth"])
+    metrics.set_callback(
+        "qotd_outbound_sent_total", "counter", "Messages and reactions sent from the outbound queue",
+        lambda: slack_client.get_outbound_stats()["sent"])
+    metrics.set_callback(
+        "qotd_outbound_latency_seconds", "gauge",
+        "Seconds from queueing a message or reaction to sending it: recent percentiles, and the max ever",
+        lambda: {"quantile": get_outbound_latencies(slack_client.get_outbound_stats())})
+    metrics.set_callback(
+        "qotd_response_cache_hits_total", "counter", "Read-only command responses reused from the cache, by keeper",
+        lambda: get_by_keeper(lambda keeper: keeper.response_cache.hits))
+    metrics.set_callback(
+        "qotd_response_cache_misses_total", "counter", "Read-only command responses that had to be rendered, by keeper",
+        lambda: get_by_keeper(lambda keeper: keeper.response_cache.misses))
+
+
+def get_by_keeper(get_value: Callable) -> Dict[str, Dict[str, float]]:
+    return {"keeper": {type(keeper).__name__: get_value(keeper)
+                       for keeper in [question_keeper, score_keeper, poll_keeper] if keeper}}
+
+
+def get_outbound_latencies(outbound_stats: Dict[str, float]) -> Dict[str, float]:
+    return {"0.5": outbound_stats["p50_latency"], "0.95": outbound_stats["p95_latency"],
+            "0.99": outbound_stats["p99_latency"], "1": outbound_stats["max_latency"]}
+
+
+# Asks Slack for the bot's own user ID, which it needs to tell when it's being mentioned.
+# Waits as long as it takes for Slack to answer, but raises ConnectionError if the token is the problem,
+#   since waiting won't fix that
+def get_bot_id_from_slack() -> str:
+    while True:
+        auth_response = slack_client.api_call("auth.test")
+        if auth_response.get("ok"):
+            return auth_response["user_id"]
+        if auth_response.get("error") in FATAL_AUTH_ERRORS:
+            raise ConnectionError("Slack won't accept the bot's token: " + str(auth_response.get("error")))
+
+        log("Couldn't get the bot's user ID (" + str(auth_response.get("error")) + "). Retrying in "
+            + str(AUTH_RETRY_DELAY) + " seconds...\n")
+        time.sleep(AUTH_RETRY_DELAY)
+
+
+# Everything one rtm_read returns is a batch, and every command in it gets handled, in the order they came in
+def read_bot_commands() -> List[dict]:
+    return list(slack_client.parse_bot_commands(slack_client.rtm_read()))
+
+
+def handle_bot_commands(parsed_events: List[dict]):
+    for parsed_event in parsed_events:
+        command_keeper.handle_event(parsed_event)
+
+
+def count_by_published(items: list) -> Dict[str, int]:
+    published_count = len([item for item in items if item.published])
+    return {"published": published_count, "unpublished": len(items) - published_count}
+
 
 # ----------------------------------
 
@@ -1208,36 +1518,62 @@ if __name__ == "__main__":
 
     print("Creating slack client")
     slack_client = WellBehavedSlackClient(SLACK_BOT_TOKEN)
+    # The outbound thread dies with the bot, so however it goes down, send what's still queued first
+    atexit.register(slack_client.flush_outbound, OUTBOUND_SHUTDOWN_TIMEOUT)
 
     if slack_client.rtm_connect(with_team_state=False):
 
-        question_keeper = QuestionKeeper()
-        score_keeper = ScoreKeeper(slack_client)
+        storage = open_storage()
+        question_keeper = QuestionKeeper(storage)
+        score_keeper = ScoreKeeper(slack_client, storage)
         command_keeper = CommandKeeper()
-        poll_keeper = PollKeeper()
+        poll_keeper = PollKeeper(storage)
+
+        register_metrics_callbacks()
+        start_metrics_server()
+
+        # Exit normally on SIGTERM too, so pending changes get written out on the way down
+        signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
 
         print("QOTD Bot connected and running!")
         # Read bot's user ID by calling Web API method `auth.test`
-        slack_client.set_bot_id(slack_client.api_call("auth.test")["user_id"])
+        try:
+            slack_client.set_bot_id(get_bot_id_from_slack())
+        except ConnectionError as auth_error:
+            print(str(auth_error))
+            sys.exit(1)
         while True:
             # The client can reject our rtm_read call for many reasons
             # So when that happens, we wait 3 seconds and try to reconnect
             # If there is no internet connection, this will continue to loop until there is
             try:
-                parsed_event = slack_client.parse_bot_commands(slack_client.rtm_read())
-            except BaseException as parsing_error:
+                parsed_events = read_bot_commands()
+            except Exception as parsing_error:
                 log("Connection Error. Retrying in 3 seconds...")
                 log("Exception details: " + str(parsing_error))
                 time.sleep(3)
                 try:
                     slack_client.rtm_connect(with_team_state=False)
-                except BaseException as connection_error:
+                except Exception as connection_error:
                     log("Couldn't reconnect :(")
                     log("Exception details: " + str(connection_error))
                     continue
                 continue
-            if parsed_event:
-                command_keeper.handle_event(parsed_event)
-            time.sleep(RTM_READ_DELAY)
+            # Handle every command that came in together. If there were any, more could be on the way,
+            #   so only wait before reading again when things are quiet
+            handle_bot_commands(parsed_events)
+
+            try:
+                run_scheduled_tasks()
+            except Exception as e:
+                slack_client.dev_log("A scheduled task failed:\n\n" + str(e) + "\n\n" + traceback.format_exc())
+
+            try:
+                save_due_changes()
+            except Exception as e:
+                log("Couldn't save data: " + str(e) + "\n" + traceback.format_exc())
+
+            if not parsed_events:
+                time.sleep(RTM_READ_DELAY)
     else:
         print("Connection failed. Exception traceback printed above.")
@@ -1,12 +1,23 @@
+import os
 import time
 import json
-import shutil
-from typing import List, Dict, Tuple, Optional
+import heapq
+from typing import List, Dict, Set, Tuple, Optional
+
+from Utils import IOCounter, ResponseCache, timed_io
+from Persistence import DebouncedWriter
+from Storage import Storage, FileStorage
 
 MAX_GUESSES = 3
 
-QUESTIONS_FILE_NAME = "questions.json"
-OLD_QUESTIONS_FILE_NAME = "questionsHistory.json"
+# How long a question stays up after it's published before it expires on its own.
+# Set QUESTION_LIFETIME_HOURS to change it
+QUESTION_LIFETIME_HOURS = float(os.environ.get('QUESTION_LIFETIME_HOURS', 18))
+QUESTION_LIFETIME = 60 * 60 * QUESTION_LIFETIME_HOURS
+
+# We've established rules for which words/characters shouldn't matter in answers
+ANSWER_REMOVE_WORDS = {"a", "an", "the", "and"}
+ANSWER_REMOVE_CHARS_TABLE = str.maketrans("", "", "'’-,.?!\"/[](){}`~:;")
 
 
 def split_category(q_id: str) -> Tuple[str, str]:
@@ -20,6 +31,15 @@ def split_category(q_id: str) -> Tuple[str, str]:
     return q_id, category
 
 
+def format_publish_time(publish_time: float) -> str:
+    return time.strftime("%a %b %d at %H:%M", time.localtime(publish_time))
+
+
+# Question IDs are matched case-insensitively, so this is the form they're indexed under
+def id_key(q_id: str) -> str:
+    return q_id.casefold()
+
+
 class Question:
     def __init__(self, user_id: str, q_id: str, question_text: str,
                  correct_answers: List[str]=None, category: str =""):
@@ -33,51 +53,54 @@ class Question:
         self.init_time: float = time.time()
         self.publish_time: float = 0
         self.expire_time: float = 0
+        self.scheduled_publish_time: float = 0  # When to publish automatically, if it's been scheduled
         self.published: bool = False
         self.just_published: bool = False
-        self.answered_by: List[str] = []
+        self.answered_by: List[str] = []  # In the order they answered
+        self.answered_by_set: Set[str] = set()  # The same users, for quick lookups
         self.guesses: Dict[str, int] = {}
+        # Cleaned-up forms of correct_answers. Built on first use, and thrown out whenever the answers change
+        self.normalized_answers: Optional[Set[str]] = None
 
-    # We've established rules for which words/characters shouldn't matter in answers.
-    # Here is where those get dealt with
+    # Here is where the rules for which words/characters shouldn't matter in answers get dealt with.
+    # Words are dropped before characters, so e.g. "a." is left alone as the word "a"
     @staticmethod
     def clean_up_answer(answer: str) -> str:
-        answer = answer.lower().strip()
-        words = answer.split(' ')
-        remove_words = ["a", "an", "the", "and"]
-        remove_chars = "'’-,.?!\"/[](){}`~:;"
-
-        stripped_words = [word for word in words if word not in remove_words]
-        answer = ' '.join(stripped_words).strip()
+        words = answer.lower().strip().split(' ')
+        answer = ' '.join([word for word in words if word not in ANSWER_REMOVE_WORDS])
+        return answer.translate(ANSWER_REMOVE_CHARS_TABLE).strip()
 
-        for char in remove_chars:
-            answer = answer.replace(char, "")
-
-        answer = answer.strip()
-        return answer
+    def get_normalized_answers(self) -> Set[str]:
+        if self.normalized_answers is None:
+            self.normalized_answers = {self.clean_up_answer(correct_answer) for correct_answer in self.correct_answers}
+        return self.normalized_answers
 
     # This is just for determining answer correctness
     # If we add a feature in the future for requiring a list of items to all be matched,
     #   here is where that should be added.
     def validate_answer(self, input_answer: str) -> bool:
-        for correct_answer in self.correct_answers:
-            match = self.clean_up_answer(correct_answer) == self.clean_up_answer(input_answer)
-            if match:
-                return True
-        return False
+        return self.clean_up_answer(input_answer) in self.get_normalized_answers()
 
     def check_answer(self, user_id, input_answer: str) -> bool:
-        if self.validate_answer(input_answer) and user_id not in self.answered_by:
-            self.answered_by.append(user_id)
+        if self.validate_answer(input_answer) and not self.has_answered(user_id):
+            self.add_user_who_answered(user_id)
             return True
         return False
 
+    def has_answered(self, user_id: str) -> bool:
+        return user_id in self.answered_by_set
+
+    def has_used_all_guesses(self, user_id: str) -> bool:
+        return self.guesses.get(user_id, 0) >= MAX_GUESSES
+
     def add_answer(self, new_answer: str):
         self.correct_answers.append(new_answer)
+        self.normalized_answers = None
 
     def remove_answer(self, existing_answer: str) -> bool:
         if existing_answer in self.correct_answers:
             self.correct_answers.remove(existing_answer)
+            self.normalized_answers = None
             return True
         else:
             return False
@@ -87,13 +110,50 @@ class Question:
         return True
 
     def add_user_who_answered(self, user_id: str) -> bool:
-        if user_id in self.answered_by:
+        if self.has_answered(user_id):
             return False
         self.answered_by.append(user_id)
+        self.answered_by_set.add(user_id)
         return True
 
+    def get_expiry_deadline(self) -> float:
+        return self.publish_time + QUESTION_LIFETIME
+
     def time_to_expire(self) -> bool:
-        return self.published and (time.time() - self.publish_time) > 60 * 60 * 18  # 18 hours
+        return self.published and time.time() > self.get_expiry_deadline()
+
+    # The on-disk format of a question. Used for the questions file, the journal, and the history file
+    def to_json(self) -> dict:
+        return {
+            "user_id": self.user_id,
+            "qID": self.q_id,
+            "questionText": self.question_text,
+            "correctAnswers": self.correct_answers,
+            "category": self.category,
+            "initTime": self.init_time,
+            "publishTime": self.publish_time,
+            "expireTime": self.expire_time,
+            "scheduledPublishTime": self.scheduled_publish_time,
+            "published": self.published,
+            "justPublished": self.just_published,
+            "answeredBy": self.answered_by,
+            "guesses": self.guesses
+        }
+
+    @staticmethod
+    def from_json(q_json: dict) -> 'Question':
+        q = Question(q_json["user_id"], q_json["qID"], q_json["questionText"], q_json["correctAnswers"],
+                     q_json["category"])
+        q.init_time = q_json["initTime"]
+        q.publish_time = q_json["publishTime"]
+        q.expire_time = q_json.get("expireTime", 0)
+        q.scheduled_publish_time = q_json.get("scheduledPublishTime", 0)
+        q.published = q_json["published"]
+        q.just_published = q_json["justPublished"]
+        q.answered_by = q_json["answeredBy"]
+        q.answered_by_set = set(q.answered_by)
+        q.guesses = q_json["guesses"]
+        return q
 
     # Display a question with its category and ID in a nicely formatted way
     def pretty_print(self) -> str:
@@ -125,87 +185,151 @@ class Question:
             self.published = True
             self.just_published = True
             self.publish_time = time.time()
+            self.scheduled_publish_time = 0
             return True
 
 
 class QuestionKeeper:
-    def __init__(self):
-        self.question_list: List[Question] = []
+    def __init__(self, storage: Optional[Storage] = None):
+        self.storage: Storage = storage if storage else FileStorage()
+        # Every active question by ID key, in the order they were added, so adding, finding and removing
+        #   one are all O(1). Changes have to go through add_to_question_list/remove_from_question_list,
+        #   which keep the indexes below in sync
+        self.questions_by_id: Dict[str, Question] = {}
+        self.questions_by_user: Dict[str, Dict[str, Question]] = {}
+        # User ID -> ID keys of the questions they've answered, and of the ones they've used up their guesses on.
+        #   Kept up to date by add_to_question_list/remove_from_question_list and update_user_progress
+        self.answered_by_user: Dict[str, Set[str]] = {}
+        self.exhausted_by_user: Dict[str, Set[str]] = {}
+        # Published questions as (expiry deadline, ID key), soonest first.
+        #   Entries aren't removed when questions are, so they get checked against questions_by_id when popped
+        self.expiry_heap: List[Tuple[float, str]] = []
+        # Questions scheduled to be published, as (publish time, ID key), soonest first. Checked the same way
+        self.publish_heap: List[Tuple[float, str]] = []
+        # Questions published since the last first_time_display, in the order they were published
+        self.newly_published: Dict[str, Question] = {}
+        # Changes waiting to be saved, as ID key -> ("put", question) or ("remove", q_id).
+        # Only the latest change to each question matters, so several changes to one question cost one record
+        self.pending_journal: Dict[str, Tuple[str, object]] = {}
+        self.journal_writer = DebouncedWriter(self.flush_journal)
+        self.io = IOCounter()
+        # Every change to the questions or their history gets saved,
+        #   so queue_journal_record and append_to_history are the only places that need to invalidate it
+        self.response_cache = ResponseCache()
         self.load_questions_from_file()
 
-    # This only runs on startup to retrieve questions from the persistent file
+    def add_to_question_list(self, q: Question):
+        self.questions_by_id[id_key(q.q_id)] = q
+        self.questions_by_user.setdefault(q.user_id, {})[id_key(q.q_id)] = q
+        for user_id in q.answered_by_set.union(q.guesses):
+            self.update_user_progress(q, user_id)
+
+    def remove_from_question_list(self, q: Question):
+        del self.questions_by_id[id_key(q.q_id)]
+        users_questions = self.questions_by_user[q.user_id]
+        del users_questions[id_key(q.q_id)]
+        if not users_questions:
+            del self.questions_by_user[q.user_id]
+        for user_id in q.answered_by_set.union(q.guesses):
+            self.answered_by_user.get(user_id, set()).discard(id_key(q.q_id))
+            self.exhausted_by_user.get(user_id, set()).discard(id_key(q.q_id))
+
+    # Call whenever a user answers or guesses on a question, to keep answered_by_user/exhausted_by_user in sync
+    def update_user_progress(self, q: Question, user_id: str):
+        if q.has_answered(user_id):
+            self.answered_by_user.setdefault(user_id, set()).add(id_key(q.q_id))
+        if q.has_used_all_guesses(user_id):
+            self.exhausted_by_user.setdefault(user_id, set()).add(id_key(q.q_id))
+
+    # Whether a user still has a shot at a question: they haven't answered it or run out of guesses
+    def can_still_attempt(self, user_id: str, q: Question) -> bool:
+        return id_key(q.q_id) not in self.answered_by_user.get(user_id, ()) \
+            and id_key(q.q_id) not in self.exhausted_by_user.get(user_id, ())
+
+    # This only runs on startup to retrieve questions from storage
     def load_questions_from_file(self):
-        try:
-            file = open(QUESTIONS_FILE_NAME)
-        except IOError:
-            # If not exists, create the file
-            questions_json = {"questions": []}
-            file = open(QUESTIONS_FILE_NAME, "w+")
-            json.dump(questions_json, file, indent=4)
-        file.close()
-
-        with open(QUESTIONS_FILE_NAME) as q_file:
-            d = json.load(q_file)
-            for q_json in d["questions"]:
-                q = Question(q_json["user_id"], q_json["qID"], q_json["questionText"], q_json["correctAnswers"],
-                             q_json["category"])
-                q.init_time = q_json["initTime"]
-                q.publish_time = q_json["publishTime"]
-                q.published = q_json["published"]
-                q.just_published = q_json["justPublished"]
-                q.answered_by = q_json["answeredBy"]
-                q.guesses = q_json["guesses"]
-
-                self.question_list.append(q)
+        for q_json in self.storage.load_questions():
+            self.add_to_question_list(Question.from_json(q_json))
+
+        self.expiry_heap = [(q.get_expiry_deadline(), id_key(q.q_id)) for q in self.questions_by_id.values()
+                            if q.published]
+        heapq.heapify(self.expiry_heap)
+        self.publish_heap = [(q.scheduled_publish_time, id_key(q.q_id)) for q in self.questions_by_id.values()
+                             if q.scheduled_publish_time and not q.published]
+        heapq.heapify(self.publish_heap)
+        self.newly_published = {id_key(q.q_id): q for q in self.questions_by_id.values() if q.just_published}
+
+        if self.storage.wants_question_snapshot():
+            self.write_questions_to_file()
 
-    @staticmethod
-    def back_up_data() -> Dict[str, str]:
+    def back_up_data(self) -> Dict[str, str]:
         data = {}
 
-        file = open(QUESTIONS_FILE_NAME)
-        data["questions"] = file.read()
-        file.close()
+        # Fold the journal and any pending changes in first, so storage is up to date
+        questions_json = {"questions": [q.to_json() for q in self.questions_by_id.values()]}
+        self.write_questions_to_file()
+        data["questions"] = json.dumps(questions_json, indent=4)
 
-        file = open(OLD_QUESTIONS_FILE_NAME)
-        data["old-questions"] = file.read()
-        file.close()
+        # The backup is the one place we want the whole history, newest first like the old history file
+        data["old-questions"] = json.dumps({"oldQuestions": self.storage.read_history()})
 
         return data
 
-    # This is run every time a change occurs to the questionsList data (adding, removing, publishing, guesses being
-    # made, etc). If the bot crashes at any point, we shouldn't lose too much history. This comes at the cost of
-    # frequent write operations, which get costly as the number of questions active at one time grows
+    # Writes a full snapshot of the question list, after which the journal can be emptied.
+    # This happens on startup, on backups, and whenever storage says enough changes have piled up.
+    # The snapshot includes any changes still waiting to go into the journal
+    @timed_io
     def write_questions_to_file(self):
-        questions_json = {"questions": []}
-
-        for q in self.question_list:
-            questions_json["questions"].append(vars(q))
-
-        with open(QUESTIONS_FILE_NAME, 'w') as tempfile:
-            json.dump(questions_json, tempfile, indent=4)
-
-        shutil.move(tempfile.name, QUESTIONS_FILE_NAME)
-
-    # When questions expire (not get removed), we insert them into the running history of questions in a persistent file
-    @staticmethod
-    def write_removed_questions_to_file(removed_questions_list: List[Question]):
-        try:
-            file = open(OLD_QUESTIONS_FILE_NAME)
-            questions_json = json.load(file)
-        except IOError:
-            # If not exists, create the file
-            questions_json = {"oldQuestions": []}
-            file = open(OLD_QUESTIONS_FILE_NAME, "w+")
-            json.dump(questions_json, file, indent=4)
-        file.close()
-
-        for q in removed_questions_list:
-            questions_json["oldQuestions"].insert(0, vars(q))
-
-        with open(OLD_QUESTIONS_FILE_NAME, 'w') as tempfile:
-            json.dump(questions_json, tempfile, indent=4)
+        self.io.bytes_written += self.storage.write_question_snapshot(
+            [q.to_json() for q in self.questions_by_id.values()])
+        self.pending_journal = {}
+
+    # Every change to the question list (adding, removing, publishing, guesses being made, etc) gets saved as a
+    # single record, so that if the bot crashes at any point, we shouldn't lose any history.
+    # Saving only the questions that changed keeps this cheap no matter how many questions are active,
+    #   and changes within PERSIST_COALESCE_WINDOW of each other get saved together
+    @timed_io
+    def flush_journal(self):
+        if not self.pending_journal:
+            return
+
+        changes = []
+        for key, (op, item) in self.pending_journal.items():
+            changes.append((key, op, item.to_json() if op == "put" else item))
+
+        self.io.bytes_written += self.storage.save_question_changes(changes)
+        self.pending_journal = {}
+
+        if self.storage.wants_question_snapshot():
+            self.write_questions_to_file()
 
-        shutil.move(tempfile.name, OLD_QUESTIONS_FILE_NAME)
+    def queue_journal_record(self, q_id: str, op: str, item: object):
+        self.response_cache.invalidate()
+        # Replaying a removal then a re-add puts the question last, which one coalesced "put" wouldn't,
+        #   so the removal gets saved first
+        pending = self.pending_journal.get(id_key(q_id))
+        if pending and pending[0] == "remove" and op == "put":
+            self.flush_journal()
+        # Records stay where the question's first change since the last save put them,
+        #   so new questions are replayed in the order they were added
+        self.pending_journal[id_key(q_id)] = (op, item)
+        self.journal_writer.mark_dirty()
+
+    def save_question(self, q: Question):
+        self.queue_journal_record(q.q_id, "put", q)
+
+    def save_question_removal(self, q: Question):
+        self.queue_journal_record(q.q_id, "remove", q.q_id)
+
+    @timed_io
+    def append_to_history(self, old_questions: List[dict]):
+        self.response_cache.invalidate()
+        self.io.bytes_written += self.storage.append_to_history(old_questions)
+
+    # When questions expire (not get removed), we append them to the running history of questions
+    def write_removed_questions_to_file(self, removed_questions_list: List[Question]):
+        if removed_questions_list:
+            self.append_to_history([q.to_json() for q in removed_questions_list])
 
     def add_question(self, user_id: str, q_id: str, question_text: str, correct_answers: List[str]=None) -> bool:
         if correct_answers is None:
@@ -213,26 +337,26 @@ class QuestionKeeper:
         q_id, category = split_category(q_id)
 
         # prevent duplicate IDs
-        for q in self.question_list:
-            if q_id.lower() == q.q_id.lower():
-                return False
+        if id_key(q_id) in self.questions_by_id:
+            return False
 
-        self.question_list.append(Question(user_id, q_id, question_text, correct_answers, category))
+        q = Question(user_id, q_id, question_text, correct_answers, category)
+        self.add_to_question_list(q)
 
         # save new data
-        self.write_questions_to_file()
+        self.save_question(q)
         return True
 
     def remove_question(self, q_id: str, user_id: str) -> bool:
         q_id, category = split_category(q_id)
 
-        for q in self.question_list:
-            if q_id.lower() == q.q_id.lower() and (q.user_id == user_id or user_id == "DEV"):
-                self.question_list.remove(q)
+        q = self.get_user_question_by_id(q_id, user_id)
+        if q:
+            self.remove_from_question_list(q)
 
-                # save new data
-                self.write_questions_to_file()
-                return True
+            # save new data
+            self.save_question_removal(q)
+            return True
         return False
 
     # Adds a new allowed answer for a question. The user_id must be the same as the user who submitted the Q
@@ -243,7 +367,7 @@ class QuestionKeeper:
 
         if q:
             q.add_answer(new_answer)
-            self.write_questions_to_file()
+            self.save_question(q)
             return True
         else:
             return False
@@ -255,7 +379,7 @@ class QuestionKeeper:
         q = self.get_user_question_by_id(q_id, user_id)
 
         if q and q.remove_answer(existing_answer):
-            self.write_questions_to_file()
+            self.save_question(q)
             return True
         else:
             return False
@@ -265,36 +389,31 @@ class QuestionKeeper:
 
         q = self.get_user_question_by_id(q_id, user_id)
         if q and q.set_question_text(new_question_text):
-            self.write_questions_to_file()
+            self.save_question(q)
             return True
         else:
             return False
 
     def add_user_who_answered(self, user_id: str, q_id: str) -> bool:
-        if self.get_question_by_id(q_id).add_user_who_answered(user_id):
-            self.write_questions_to_file()
+        q = self.get_question_by_id(q_id)
+        if q.add_user_who_answered(user_id):
+            self.update_user_progress(q, user_id)
+            self.save_question(q)
             return True
         return False
 
     def get_question_by_id(self, q_id: str) -> Optional[Question]:
         q_id, category = split_category(q_id)
 
-        for q in self.question_list:
-            if q_id.lower() == q.q_id.lower():
-                return q
-
-        return None
+        return self.questions_by_id.get(id_key(q_id))
 
     # Gets a question only if it was submitted by the user in question, None otherwise
     def get_user_question_by_id(self, q_id: str, user_id: str) -> Optional[Question]:
         q_id, category = split_category(q_id)
-        q_id = q_id.lower()
-
-        for q in self.question_list:
-            if q_id == q.q_id.lower() and (q.user_id == user_id or user_id == "DEV"):
-                return q
 
-        return None
+        if user_id == "DEV":
+            return self.questions_by_id.get(id_key(q_id))
+        return self.questions_by_user.get(user_id, {}).get(id_key(q_id))
 
     def get_submitter_by_q_id(self, q_id: str) -> Optional[str]:
         q = self.get_question_by_id(q_id)
@@ -309,7 +428,7 @@ class QuestionKeeper:
         q = self.get_question_by_id(q_id)
         if q and q.published:
             # Don't allow guesses after someone has answered already
-            if user_id in q.answered_by:
+            if q.has_answered(user_id):
                 return "already answered"
 
             # We want to let users give up on a question,
@@ -319,7 +438,8 @@ class QuestionKeeper:
             if input_answer.lower() in ["i give up", "give up", "giveup", "igiveup"] and not q.validate_answer(
                     input_answer):
                 q.guesses[user_id] = MAX_GUESSES
-                self.write_questions_to_file()
+                self.update_user_progress(q, user_id)
+                self.save_question(q)
                 return "gave up"
 
             # If we've made it to a point where the user is successfully attempting a guess, increment the counter
@@ -330,24 +450,27 @@ class QuestionKeeper:
 
             # Don't allow guesses beyond the max number allowed
             if q.guesses[user_id] >= MAX_GUESSES + 1:
-                self.write_questions_to_file()
+                self.save_question(q)
                 return "max guesses"
             # Manual question validation is a feature in progress, but we still allow it
             elif not q.correct_answers:
-                self.write_questions_to_file()
+                self.update_user_progress(q, user_id)
+                self.save_question(q)
                 return "needs manual"
             # Finally, we can check if the answer is actually right
             elif q.check_answer(user_id, input_answer):
-                self.write_questions_to_file()
+                self.update_user_progress(q, user_id)
+                self.save_question(q)
                 return "correct"
 
-            self.write_questions_to_file()
+            self.update_user_progress(q, user_id)
+            self.save_question(q)
             return "incorrect"
         return "not found"
 
     def list_questions(self) -> str:
         output = ""
-        for q in self.question_list:
+        for q in self.questions_by_id.values():
             if q.published:
                 output += q.pretty_print() + "\n"
         return output
@@ -360,11 +483,9 @@ class QuestionKeeper:
     #       -They haven't reached the max number of guesses
     def list_questions_private(self, user_id: str) -> str:
         output = ""
-        for q in self.question_list:
+        for q in self.questions_by_id.values():
             if q.published:
-                if user_id not in q.answered_by \
-                        and user_id != q.user_id \
-                        and (user_id not in q.guesses or q.guesses[user_id] < MAX_GUESSES):
+                if user_id != q.user_id and self.can_still_attempt(user_id, q):
                     output += "● "
                 output += q.pretty_print() + "\n"
         return output
@@ -372,44 +493,108 @@ class QuestionKeeper:
     # Same as listQuestionsPrivate, except we just omit the questions that wouldn't have had a bullet point
     def list_incomplete_questions_private(self, user_id: str) -> str:
         output = ""
-        for q in self.question_list:
-            if q.published \
-                    and user_id not in q.answered_by \
-                    and (user_id not in q.guesses or q.guesses[user_id] < MAX_GUESSES):
+        for q in self.questions_by_id.values():
+            if q.published and self.can_still_attempt(user_id, q):
                 output += q.pretty_print() + "\n"
         return output
 
     # Called by `my-questions`. Displays a user's questions with answers
     def list_questions_by_user(self, user_id: str) -> str:
         output = ""
-        for q in self.question_list:
-            if q.user_id == user_id:
-                output += q.pretty_print_with_answer() + (" (published)" if q.published else "") + "\n"
+        for q in self.questions_by_user.get(user_id, {}).values():
+            output += q.pretty_print_with_answer() + (" (published)" if q.published else "")
+            if q.scheduled_publish_time and not q.published:
+                output += " (publishing " + format_publish_time(q.scheduled_publish_time) + ")"
+            output += "\n"
         return output
 
-    # Expires all questions over a certain age (right now we're using 18 hours) from a specific user.
+    # Expires all questions over a certain age (QUESTION_LIFETIME) from a specific user.
     # Returns a list of questions that got expired
     def expire_questions(self, user_id: str) -> List[Question]:
+        questions_expired = [q for q in self.questions_by_user.get(user_id, {}).values() if q.time_to_expire()]
+        self.expire(questions_expired)
+        return questions_expired
+
+    # Expires every question whose time is up, without looking at any that aren't.
+    # Everything due at once is saved to history together. Returns a list of questions that got expired
+    def expire_due_questions(self) -> List[Question]:
+        now = time.time()
         questions_expired = []
-        for q in self.question_list:
-            if q.time_to_expire() and q.user_id == user_id:
-                q.expireTime = time.time()
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            deadline, key = heapq.heappop(self.expiry_heap)
+            q = self.questions_by_id.get(key)
+            # Skip entries for questions that were removed, or replaced by a newer question with the same ID
+            if q and q.published and q.get_expiry_deadline() == deadline:
                 questions_expired.append(q)
 
-        self.question_list = [q for q in self.question_list if q not in questions_expired]
+        self.expire(questions_expired)
+        return questions_expired
 
-        self.write_questions_to_file()
+    def expire(self, questions_expired: List[Question]):
+        for q in questions_expired:
+            q.expire_time = time.time()
+            self.remove_from_question_list(q)
+            self.save_question_removal(q)
         self.write_removed_questions_to_file(questions_expired)
 
-        return questions_expired
+    def schedule_expiry(self, q: Question):
+        heapq.heappush(self.expiry_heap, (q.get_expiry_deadline(), id_key(q.q_id)))
+
+    def publish_question(self, q: Question) -> bool:
+        if not q.publish():
+            return False
+        self.newly_published[id_key(q.q_id)] = q
+        self.schedule_expiry(q)
+        self.save_question(q)
+        return True
+
+    # Sets a question to be published later, by publish_due_questions
+    def schedule_publish(self, q: Question, publish_time: float):
+        q.scheduled_publish_time = publish_time
+        heapq.heappush(self.publish_heap, (publish_time, id_key(q.q_id)))
+        self.save_question(q)
+
+    def schedule_publish_by_id(self, q_id: str, publish_time: float) -> str:
+        q = self.get_question_by_id(q_id)
+        if q:
+            if q.published:
+                return "already published"
+            self.schedule_publish(q, publish_time)
+            return "scheduled"
+        else:
+            return "notFound"
+
+    # Returns how many questions got scheduled
+    def schedule_publish_all_by_user(self, user_id: str, publish_time: float) -> int:
+        unpublished = [q for q in self.questions_by_user.get(user_id, {}).values() if not q.published]
+        for q in unpublished:
+            self.schedule_publish(q, publish_time)
+        return len(unpublished)
+
+    # Publishes every question whose scheduled time has come, without looking at any others.
+    # Returns the questions that got published, which are left out of the next first_time_display,
+    #   since whoever calls this is expected to announce them
+    def publish_due_questions(self) -> List[Question]:
+        now = time.time()
+        questions_published = []
+        while self.publish_heap and self.publish_heap[0][0] <= now:
+            publish_time, key = heapq.heappop(self.publish_heap)
+            q = self.questions_by_id.get(key)
+            # Skip entries for questions that were removed, published early, or rescheduled
+            if q and not q.published and q.scheduled_publish_time == publish_time:
+                q.publish()
+                q.just_published = False
+                self.schedule_expiry(q)
+                self.save_question(q)
+                questions_published.append(q)
+        return questions_published
 
     # Publishes one question
     # Should be made user-exclusive in the future
     def publish_by_id(self, q_id: str) -> str:
         q = self.get_question_by_id(q_id)
         if q:
-            if q.publish():
-                self.write_questions_to_file()
+            if self.publish_question(q):
                 return "published"
             else:
                 return "already published"
@@ -417,45 +602,28 @@ class QuestionKeeper:
             return "notFound"
 
     def publish_all_by_user(self, user_id: str):
-        for q in self.question_list:
-            if q.user_id == user_id:
-                q.publish()
-        self.write_questions_to_file()
+        for q in self.questions_by_user.get(user_id, {}).values():
+            self.publish_question(q)
 
     # When a question/questions get published
     def first_time_display(self) -> str:
         output = ""
-        for q in self.question_list:
-            if q.just_published:
+        for q in self.newly_published.values():
+            # Could have been removed since it was published
+            if q.just_published and self.questions_by_id.get(id_key(q.q_id)) is q:
                 q.just_published = False
                 output += q.pretty_print() + "\n"
-        self.write_questions_to_file()
+                self.save_question(q)
+        self.newly_published = {}
         return output
 
-    # Reads from the questions history file, and returns a string of displayed question that expired less than 24
+    # Reads from the questions history, and returns a string of displayed question that expired less than 24
     # hours ago
-    @staticmethod
-    def get_old_questions_string() -> str:
-        try:
-            file = open(OLD_QUESTIONS_FILE_NAME)
-            old_questions = json.load(file)
-        except IOError:
-            # If not exists, create the file
-            old_questions = {"oldQuestions": []}
-            file = open(OLD_QUESTIONS_FILE_NAME, "w+")
-            json.dump(old_questions, file, indent=4)
-        file.close()
-
-        now = time.time()
+    def get_old_questions_string(self) -> str:
         elapsed_time = 60 * 60 * 24  # 24 hours
         response = ""
 
-        for q in old_questions["oldQuestions"]:
-            # Questions are inserted at the beginning of the data
-            # So it's sorted newer to older
-            # Thus if we hit a question older than 24hrs, we can stop searching
-            if (now - q["expireTime"]) > elapsed_time:
-                break
+        for q in self.storage.read_history(since=time.time() - elapsed_time):
             response += "" if q["category"] == "" else (q["category"] + " ")
             response += "(" + q["qID"] + "): " + q["questionText"] + " : " + (
                 " : ".join(q["correctAnswers"]) if len(q["correctAnswers"]) > 0 else "(no answer given)")
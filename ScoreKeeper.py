@@ -1,36 +1,134 @@
+import os
 import csv
-import shutil
-from datetime import datetime, timedelta
-from typing import Optional
-
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from typing import Dict, List, Optional, Tuple, Iterator
+
+from Utils import IOCounter, ResponseCache, timed_io
+from Persistence import DebouncedWriter, atomic_write
+from Storage import Storage, FileStorage
+
+# Score events kept in storage are the source of truth. The CSV is a day-by-user export of them, kept for
+#   compatibility, and is only read when there are no score events saved yet
 SCORES_FILE_NAME = "scores.csv"
 
+DATE_FORMAT = "%m/%d/%Y"
+
+# Marks a score cell for a user who got no points that day, which shows up blank rather than as 0
+EMPTY_CELL = -2 ** 31
+
+# Days (and months) roll over at midnight in this timezone, e.g. "America/New_York". Set QOTD_TIMEZONE to change it.
+# The machine's local time is used if it's not set
+SCORES_TIMEZONE = ZoneInfo(os.environ['QOTD_TIMEZONE']) if os.environ.get('QOTD_TIMEZONE') else None
+
+
+def get_current_date() -> date:
+    return datetime.now(SCORES_TIMEZONE).date()
+
+
+# When the day after `day` starts, as a timestamp
+def get_next_midnight(day: date) -> float:
+    return datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=SCORES_TIMEZONE).timestamp()
+
 
 def to_int(s):
     s = str(s).strip()
     return int(s) if s else 0
 
 
+# Keeps users sorted by score as scores change, so rankings never need a full sort.
+# Entries are (score, name, user ID) in ascending order, so reading them backwards gives the same order as
+#   sorting (score, name) pairs with reverse=True
+class Leaderboard:
+    def __init__(self):
+        self.entries: List[Tuple[int, str, str]] = []
+        self.entry_by_user: Dict[str, Tuple[int, str, str]] = {}
+
+    def clear(self):
+        self.entries = []
+        self.entry_by_user = {}
+
+    def set_score(self, user_id: str, name: str, score: int):
+        self.remove(user_id)
+        entry = (score, name, user_id)
+        insort(self.entries, entry)
+        self.entry_by_user[user_id] = entry
+
+    def set_name(self, user_id: str, name: str):
+        if user_id in self.entry_by_user:
+            self.set_score(user_id, name, self.entry_by_user[user_id][0])
+
+    def remove(self, user_id: str):
+        entry = self.entry_by_user.pop(user_id, None)
+        if entry is not None:
+            del self.entries[bisect_left(self.entries, entry)]
+
+    # Returns (score, name) pairs from first place down, only the top n if n is given
+    def ranked(self, n: Optional[int] = None) -> List[Tuple[int, str]]:
+        start = 0 if n is None else max(len(self.entries) - n, 0)
+        return [(score, name) for score, name, user_id in reversed(self.entries[start:])]
+
+    # 1 for first place, None if the user isn't on the board
+    def get_rank(self, user_id: str) -> Optional[int]:
+        entry = self.entry_by_user.get(user_id)
+        if entry is None:
+            return None
+        return len(self.entries) - bisect_right(self.entries, entry) + 1
+
+    @staticmethod
+    def format_ranking(ranking: List[Tuple[int, str]]) -> str:
+        return "\n".join([str(idx + 1) + ": " + name + " - " + str(score) for idx, (score, name) in enumerate(ranking)])
+
+
 class ScoreKeeper:
-    def __init__(self, slack_client):
+    def __init__(self, slack_client, storage: Optional[Storage] = None):
         self.slackClient = slack_client
-        self.data = []
+        self.storage: Storage = storage if storage else FileStorage()
+        self.io = IOCounter()
+
+        # The score matrix, with a column per user and a row per day, oldest first.
+        # Rows are arrays of ints with EMPTY_CELL where a user got no points that day,
+        #   and only get turned into strings when exported to the CSV
+        self.user_ids: List[str] = []
+        self.user_names: List[str] = []
+        self.column_by_user: Dict[str, int] = {}
+        self.dates: List[str] = []
+        self.rows: List[array] = []
+        self.row_num_by_date: Dict[str, int] = {}
+        self.totals = array('i')  # Points so far this month
+        # Running sums of the rows: each user's points from the first day through that row's day,
+        #   so the points for any range of days are one row minus another
+        self.cumulative: List[array] = []
         self.today_row_num = -1  # error value
-        self.totals_row_num = 2  # manually chosen
-        self.user_id_row_num = 0  # manually chosen
-        self.user_name_row_num = 1  # manually chosen
 
-        self.get_data_from_file()
-        self.catch_up_date_rows()
+        # The date of today's row, kept so points don't need any dates parsed, and when it stops being today
+        self.today: Optional[date] = None
+        self.next_rollover = 0.0
+
+        # Score events waiting to be saved, and the CSV export, are both written out in batches
+        self.pending_events: List[dict] = []
+        self.ledger_writer = DebouncedWriter(self.flush_ledger)
+        self.export_writer = DebouncedWriter(self.update_file_with_data)
+
+        # Invalidated by every change to the score matrix: events being applied, and totals being recalculated
+        self.response_cache = ResponseCache()
+
+        # Rankings for today's row and the monthly totals row, updated as points come in
+        self.today_leaderboard = Leaderboard()
+        self.month_leaderboard = Leaderboard()
+
+        self.load_ledger()
+        self.today = datetime.strptime(self.dates[self.today_row_num], DATE_FORMAT).date()
+        self.roll_over_if_due()
 
     def get_today_scores(self) -> str:
         scores_list = []
-        today_scores = self.data[self.today_row_num]
-        for column, score in enumerate(today_scores):
-            if column == 0:
-                continue
-            if score != "":
-                scores_list.append(self.data[self.user_name_row_num][column] + " - " + str(score))
+        for column, score in enumerate(self.rows[self.today_row_num]):
+            if score != EMPTY_CELL:
+                scores_list.append(self.user_names[column] + " - " + str(score))
         if len(scores_list) > 0:
             scores_list.sort(key=lambda s: s.lower())
             return "*Today's scores*:\n" + "\n".join(scores_list) + "\n\n"
@@ -38,123 +136,309 @@ class ScoreKeeper:
             return "No new scores from today.\n"
 
     def get_today_scores_ranked(self) -> str:
-        scores_list = []
-        today_scores = self.data[self.today_row_num]
-        for column, score in enumerate(today_scores):
-            if column == 0:
-                continue
-            if score != "":
-                scores_list.append((int(score), self.data[self.user_name_row_num][column]))
-        if len(scores_list) > 0:
-            scores_list.sort(reverse=True)
-            for idx, tupl in enumerate(scores_list):
-                user = tupl[1]
-                score = tupl[0]
-
-                scores_list[idx] = str(idx + 1) + ": " + user + " - " + str(score)
-
-            return "*Today's scores*:\n" + "\n".join(scores_list) + "\n\n"
+        if len(self.today_leaderboard.entries) > 0:
+            return "*Today's scores*:\n" + Leaderboard.format_ranking(self.today_leaderboard.ranked()) + "\n\n"
         else:
             return "No new scores from today.\n"
 
     def get_total_scores(self) -> str:
         scores_list = []
-        total_scores = self.data[self.totals_row_num]
-        for column, score in enumerate(total_scores):
-            if column == 0:
-                continue
-            if score != "" and str(score) != "0":
-                scores_list.append(self.data[self.user_name_row_num][column] + " - " + str(score))
+        for column, score in enumerate(self.totals):
+            if score != 0:
+                scores_list.append(self.user_names[column] + " - " + str(score))
 
         scores_list.sort(key=lambda s: s.lower())
         return "*Total scores from this month*:\n" + "\n".join(scores_list) + "\n"
 
     def get_total_scores_ranked(self) -> str:
-        scores_list = []
-        total_scores = self.data[self.totals_row_num]
-        for column, score in enumerate(total_scores):
-            if column == 0:
-                continue
-            if score != "" and str(score) != "0":
-                scores_list.append((int(score), self.data[self.user_name_row_num][column]))
-
-        scores_list.sort(reverse=True)
-        for idx, tupl in enumerate(scores_list):
-            user = tupl[1]
-            score = tupl[0]
-
-            scores_list[idx] = str(idx + 1) + ": " + user + " - " + str(score)
-        return "*Total scores from this month*:\n" + "\n".join(scores_list) + "\n"
+        return "*Total scores from this month*:\n" + Leaderboard.format_ranking(self.month_leaderboard.ranked()) + "\n"
+
+    # Turns a `scores` argument into the first and last days it covers, plus a description of them,
+    #   or None if it isn't a date range.
+    # Takes "week", "month", "last-month", "year", "all", or two dates like "9/1/2026..9/15/2026"
+    def get_date_range(self, range_spec: str) -> Optional[Tuple[date, date, str]]:
+        today = self.today
+        if range_spec == "week":
+            return today - timedelta(days=today.weekday()), today, "this week"
+        elif range_spec == "month":
+            return today.replace(day=1), today, "this month"
+        elif range_spec == "last-month":
+            last_day = today.replace(day=1) - timedelta(days=1)
+            return last_day.replace(day=1), last_day, last_day.strftime("%B")
+        elif range_spec == "year":
+            return today.replace(month=1, day=1), today, "this year"
+        elif range_spec == "all":
+            return date.min, today, "all time"
+        elif ".." in range_spec:
+            start_string, end_string = range_spec.split("..", 1)
+            try:
+                start = datetime.strptime(start_string, DATE_FORMAT).date()
+                end = datetime.strptime(end_string, DATE_FORMAT).date()
+            except ValueError:
+                return None
+            return start, end, start.strftime(DATE_FORMAT) + " to " + end.strftime(DATE_FORMAT)
+        return None
+
+    # Each user's points from `start` through `end`, inclusive, as an array by column.
+    # There are no points before the first day or after today, so the range gets cut down to fit
+    def get_range_totals(self, start: date, end: date) -> array:
+        first_date = self.today - timedelta(days=self.today_row_num)
+        start_row_num = max((start - first_date).days, 0)
+        end_row_num = min((end - first_date).days, self.today_row_num)
+        if start_row_num > end_row_num:
+            return array('i', [0]) * len(self.user_ids)
+
+        totals = array('i', self.cumulative[end_row_num])
+        if start_row_num > 0:
+            before_start = self.cumulative[start_row_num - 1]
+            for column in range(len(totals)):
+                totals[column] -= before_start[column]
+        return totals
+
+    # Points per user ID from `start` through `end`, inclusive, for users who got any
+    def get_points_between(self, start: date, end: date) -> Dict[str, int]:
+        totals = self.get_range_totals(start, end)
+        return {self.user_ids[column]: points for column, points in enumerate(totals) if points != 0}
+
+    def get_range_scores_ranked(self, start: date, end: date, description: str) -> str:
+        totals = self.get_range_totals(start, end)
+        ranking = sorted([(points, self.user_names[column]) for column, points in enumerate(totals) if points != 0],
+                         reverse=True)
+        if len(ranking) > 0:
+            return "*Scores from " + description + "*:\n" + Leaderboard.format_ranking(ranking) + "\n"
+        else:
+            return "No scores from " + description + ".\n"
 
     def get_user_scores(self, user_id: str) -> str:
         output = ""
         today_score = ""
         total_score = ""
-        column = None
+        column = self.column_by_user.get(user_id)
 
-        if self.user_exists(user_id):
-            column = self.get_user_column_num(user_id)
-            today_score = str(self.data[self.today_row_num][column])
-            total_score = str(self.data[self.totals_row_num][column])
+        if column is not None:
+            if self.rows[self.today_row_num][column] != EMPTY_CELL:
+                today_score = str(self.rows[self.today_row_num][column])
+            total_score = str(self.totals[column])
+
+        today_rank = self.today_leaderboard.get_rank(user_id)
+        total_rank = self.month_leaderboard.get_rank(user_id)
 
         if today_score != "":
-            output += self.data[self.user_name_row_num][column] + "'s points from today: " + today_score + '\n'
+            output += self.user_names[column] + "'s points from today: " + today_score \
+                + (" (rank " + str(today_rank) + ")" if today_rank else "") + '\n'
         if total_score != "":
-            output += self.data[self.user_name_row_num][column] + "'s total points: " + total_score
+            output += self.user_names[column] + "'s total points: " + total_score \
+                + (" (rank " + str(total_rank) + ")" if total_rank else "")
 
         if output == "":
             output = "I couldn't find any score data for that user"
 
         return output
 
+    # Writes out the CSV export of the score matrix. This isn't needed to keep scores safe,
+    #   so it only happens when days roll over and when backing up
+    @timed_io
     def update_file_with_data(self):
-        with open(SCORES_FILE_NAME, 'w', newline='') as tempfile:
-            writer = csv.writer(tempfile)
-
-            for row in self.data:
-                writer.writerow(row)
-
-        shutil.move(tempfile.name, SCORES_FILE_NAME)
-
-    def catch_up_date_rows(self):
-
-        row_length = len(self.data[0])
-
-        today = datetime.today().date()
-        last_date = datetime.strptime(self.data[-1][0], "%m/%d/%Y").date()
-
-        if today.month > last_date.month:
-            self.announce_montly_winners(last_date.strftime("%B"))
-
-        if last_date < today:
-            needs_catch_up = True
+        self.io.bytes_written += atomic_write(
+            SCORES_FILE_NAME, lambda scores_file: csv.writer(scores_file).writerows(self.get_csv_rows()), newline='')
+
+    # The score matrix laid out the way scores.csv always has been: a row of user IDs, a row of names,
+    #   a row of monthly totals, then a row per day with blanks for no points
+    def get_csv_rows(self) -> Iterator[list]:
+        yield [""] + self.user_ids
+        yield [""] + self.user_names
+        yield [""] + self.totals.tolist()
+        for date_string, row in zip(self.dates, self.rows):
+            yield [date_string] + ["" if score == EMPTY_CELL else score for score in row]
+
+    # Every change to scores and names, and every new day, is recorded as one event saved to the ledger, then
+    #   applied to the in-memory score matrix. So no matter how many days and users there are, a point costs one
+    #   small write, and points given within PERSIST_COALESCE_WINDOW of each other get saved together
+    def record_event(self, event: dict):
+        self.pending_events.append(event)
+        self.ledger_writer.mark_dirty()
+        self.apply_event(event)
+
+    @timed_io
+    def flush_ledger(self):
+        if not self.pending_events:
+            return
+        self.io.bytes_written += self.storage.append_score_events(self.pending_events)
+        self.pending_events = []
+
+    def apply_event(self, event: dict):
+        self.response_cache.invalidate()
+        if event["type"] == "day":
+            self.get_date_row_num(event["date"])
+            return
+
+        user_id = event["user"]
+        column_num = self.column_by_user.get(user_id)
+        if column_num is None:
+            column_num = self.add_user_column(user_id)
+
+        if event["type"] == "name":
+            self.user_names[column_num] = event["name"]
+            self.today_leaderboard.set_name(user_id, event["name"])
+            self.month_leaderboard.set_name(user_id, event["name"])
+        elif event["type"] == "points":
+            row_num = self.get_date_row_num(event["date"])
+            row = self.rows[row_num]
+            if row[column_num] == EMPTY_CELL:
+                row[column_num] = 0
+            row[column_num] += event["points"]
+            # Points are almost always for today, the last row, so this is usually one running sum
+            for later_row_num in range(row_num, len(self.cumulative)):
+                self.cumulative[later_row_num][column_num] += event["points"]
+            if row_num == self.today_row_num:
+                self.totals[column_num] += event["points"]
+                self.update_leaderboards(column_num)
+
+    def update_leaderboards(self, column_num: int):
+        user_id = self.user_ids[column_num]
+        name = self.user_names[column_num]
+
+        today_score = self.rows[self.today_row_num][column_num]
+        if today_score != EMPTY_CELL:
+            self.today_leaderboard.set_score(user_id, name, today_score)
         else:
-            needs_catch_up = False
+            self.today_leaderboard.remove(user_id)
 
-        while last_date < today:
+        total_score = self.totals[column_num]
+        if total_score != 0:
+            self.month_leaderboard.set_score(user_id, name, total_score)
+        else:
+            self.month_leaderboard.remove(user_id)
+
+    # Only needed when the today or totals rows get replaced wholesale, i.e. on startup
+    def rebuild_leaderboards(self):
+        self.today_leaderboard.clear()
+        self.month_leaderboard.clear()
+        for column_num in range(len(self.user_ids)):
+            self.update_leaderboards(column_num)
+
+    def add_date_row(self, date_string: str):
+        self.row_num_by_date[date_string] = len(self.rows)
+        self.dates.append(date_string)
+        self.rows.append(array('i', [EMPTY_CELL]) * len(self.user_ids))
+        if self.cumulative:
+            self.cumulative.append(array('i', self.cumulative[-1]))
+        else:
+            self.cumulative.append(array('i', [0]) * len(self.user_ids))
+
+    # Gets the number of the row for a date, adding rows up to it if needed.
+    # Events are recorded in order, so this is almost always the last row
+    def get_date_row_num(self, date_string: str) -> int:
+        row_num = self.row_num_by_date.get(date_string)
+        if row_num is not None:
+            return row_num
+
+        day = datetime.strptime(date_string, DATE_FORMAT).date()
+        if not self.dates:
+            self.add_date_row(date_string)
+            return 0
+        last_date = datetime.strptime(self.dates[-1], DATE_FORMAT).date()
+        if day < last_date:
+            raise ValueError("No score row for " + date_string)
+
+        while last_date < day:
             last_date += timedelta(days=1)
-            self.data.append([last_date.strftime("%m/%d/%Y")] + ([""] * row_length))
+            self.add_date_row(last_date.strftime(DATE_FORMAT))
+        return len(self.rows) - 1
+
+    # Builds the score matrix by replaying the ledger
+    def load_ledger(self):
+        events = self.storage.load_score_events()
+        if events is None:
+            # If not exists, create the ledger from the old score sheet, if there is one
+            for event in self.get_events_from_score_sheet():
+                self.record_event(event)
+            self.ledger_writer.flush()
+        else:
+            for event in events:
+                self.apply_event(event)
+
+        if not self.rows:
+            self.add_date_row(get_current_date().strftime(DATE_FORMAT))
 
-        if needs_catch_up:
-            self.calculate_monthly_totals()
-            self.update_file_with_data()
+        self.today_row_num = len(self.rows) - 1
+        self.calculate_monthly_totals()
 
-            self.today_row_num = len(self.data) - 1
+    @staticmethod
+    def get_events_from_score_sheet() -> List[dict]:
+        try:
+            file = open(SCORES_FILE_NAME, "r")
+        except IOError:
+            return []
+
+        with file:
+            data = list(csv.reader(file))
+
+        events = []
+        user_ids = data[0]
+        for column in range(1, len(user_ids)):
+            events.append({"type": "user", "user": user_ids[column], "time": 0})
+            if column < len(data[1]) and data[1][column] != "":
+                events.append({"type": "name", "user": user_ids[column], "name": data[1][column], "time": 0})
+
+        for row in data[3:]:
+            day_time = datetime.strptime(row[0], DATE_FORMAT).timestamp()
+            for column in range(1, min(len(row), len(user_ids))):
+                if row[column] != "":
+                    events.append({"type": "points", "user": user_ids[column], "points": to_int(row[column]),
+                                   "time": day_time, "date": row[0], "reason": "scores.csv"})
+
+        # The sheet's last day might not have any points, and leaving it out would have the ledger pick up from
+        #   the last day that did, which could be back in a month whose winners were already announced
+        if len(data) > 3:
+            events.append({"type": "day", "date": data[-1][0],
+                           "time": datetime.strptime(data[-1][0], DATE_FORMAT).timestamp()})
+        return events
+
+    # Adds rows up to today once midnight has passed. Called by the main loop every tick,
+    #   and before giving points in case the loop hasn't gotten to it yet, so it has to be cheap when not due
+    def roll_over_if_due(self):
+        if time.time() < self.next_rollover:
+            return
+
+        today = get_current_date()
+        if today > self.today:
+            self.roll_over_to(today)
+        self.next_rollover = get_next_midnight(self.today)
+
+    # Today's row and the monthly totals only change with points from today, so moving to a new day means
+    #   starting an empty today row, and moving to a new month means zeroing the totals too.
+    # Nothing from earlier days needs to be looked at again
+    def roll_over_to(self, today: date):
+        new_month = (today.year, today.month) != (self.today.year, self.today.month)
+        if new_month:
+            self.announce_montly_winners(self.today.strftime("%B"))
+
+        # Saved to the ledger so that after a restart, the score sheet picks up from this day rather than the last
+        #   day anyone got points, and the winners aren't announced again
+        self.record_event({"type": "day", "date": today.strftime(DATE_FORMAT), "time": time.time()})
+
+        self.today = today
+        self.today_row_num = len(self.rows) - 1
+        self.today_leaderboard.clear()
+        if new_month:
+            self.totals = array('i', [0]) * len(self.user_ids)
+            self.month_leaderboard.clear()
+
+        self.response_cache.invalidate()
+        self.export_writer.mark_dirty()
 
     def user_exists(self, user_id: str) -> bool:
-        return user_id in self.data[self.user_id_row_num]
+        return user_id in self.column_by_user
 
     def get_user_column_num(self, user_id: str) -> int:
-        if user_id in self.data[self.user_id_row_num]:
-            return self.data[self.user_id_row_num].index(user_id)
-        else:
-            return -1
+        return self.column_by_user.get(user_id, -1)
 
     def get_user_name_in_score_sheet(self, user_id: str) -> Optional[str]:
         column = self.get_user_column_num(user_id)
 
         if column != -1:
-            return self.data[self.user_name_row_num][column]
+            return self.user_names[column]
         else:
             return None
 
@@ -162,82 +446,67 @@ class ScoreKeeper:
         column = self.get_user_column_num(user_id)
 
         if column != -1:
-            self.data[self.user_name_row_num][column] = new_name
+            self.add_name_to_user(user_id, new_name)
             return True
         else:
             return False
 
     def add_new_user(self, user_id: str):
-        for idx, row in enumerate(self.data):
-            self.data[idx].append("")
-        self.data[self.totals_row_num][-1] = 0
-        self.data[self.user_id_row_num][-1] = user_id
+        self.record_event({"type": "user", "user": user_id, "time": time.time()})
+
+    # Returns the new column's number
+    def add_user_column(self, user_id: str) -> int:
+        column_num = len(self.user_ids)
+        self.column_by_user[user_id] = column_num
+        self.user_ids.append(user_id)
+        self.user_names.append("")
+        self.totals.append(0)
+        for row in self.rows:
+            row.append(EMPTY_CELL)
+        for sums in self.cumulative:
+            sums.append(0)
+        return column_num
 
     def add_name_to_user(self, user_id: str, user_name: str):
-        column_num = self.get_user_column_num(user_id)
-        self.data[self.user_name_row_num][column_num] = user_name
+        self.record_event({"type": "name", "user": user_id, "name": user_name, "time": time.time()})
 
-    def add_user_point(self, user_id: str):
-        self.add_user_points(user_id, 1)
+    def add_user_point(self, user_id: str, reason: str = ""):
+        self.add_user_points(user_id, 1, reason)
 
-    def add_user_points(self, user_id: str, num_points: int):
+    def add_user_points(self, user_id: str, num_points: int, reason: str = ""):
 
-        self.catch_up_date_rows()
+        self.roll_over_if_due()
 
-        column_num = self.get_user_column_num(user_id)
-        if column_num == -1:
-            self.add_new_user(user_id)
-            column_num = self.get_user_column_num(user_id)
-        if self.data[self.today_row_num][column_num] == "":
-            self.data[self.today_row_num][column_num] = 0
+        self.record_event({"type": "points", "user": user_id, "points": num_points, "time": time.time(),
+                           "date": self.dates[self.today_row_num], "reason": reason})
 
-        self.data[self.today_row_num][column_num] = int(self.data[self.today_row_num][column_num]) + num_points
-        self.data[self.totals_row_num][column_num] = int(self.data[self.totals_row_num][column_num]) + num_points
+    def back_up_data(self):
         self.update_file_with_data()
 
-    def get_data_from_file(self):
-        file = open(SCORES_FILE_NAME, "r")
-        self.data = list(csv.reader(file))
-        file.close()
-
-    @staticmethod
-    def back_up_data():
         file = open(SCORES_FILE_NAME, "r")
         scores = file.read()
         file.close()
         return scores
 
     def announce_montly_winners(self, month_name: str):
-        scores_list = []
-        total_scores = self.data[self.totals_row_num]
-        for column, score in enumerate(total_scores):
-            if column == 0:
-                continue
-            if score != "" and str(score) != "0":
-                scores_list.append((int(score), self.data[self.user_name_row_num][column]))
-
-        scores_list.sort(reverse=True)
-        scores_list = scores_list[:min(3, len(scores_list))]
-        for idx, tupl in enumerate(scores_list):
-            user = tupl[1]
-            score = tupl[0]
-
-            scores_list[idx] = str(idx + 1) + ": " + user + " - " + str(score)
-
-        self.slackClient.say("DEPLOY_CHANNEL", "Winners from " + month_name + "!\n" + "\n".join(scores_list) + "\n")
+        winners = Leaderboard.format_ranking(self.month_leaderboard.ranked(3))
+        self.slackClient.say("DEPLOY_CHANNEL", "Winners from " + month_name + "!\n" + winners + "\n")
 
+    # Sums up the month so far from scratch. Only needed on startup, since points and rollovers keep the totals
+    #   up to date after that
     def calculate_monthly_totals(self):
-        today_month = int(self.data[self.today_row_num][0].split("/")[0])
-
-        temp_row = self.today_row_num
-        temp_month = today_month
+        month, _, year = self.dates[self.today_row_num].split("/")
 
-        totals = [0] * (len(self.data[temp_row]) - 1)
+        totals = array('i', [0]) * len(self.user_ids)
 
-        while temp_month == today_month:
-            totals = [sum(x) for x in zip(totals, [to_int(s) for s in self.data[temp_row][1:]])]
-            temp_row -= 1
-            temp_month = int(self.data[temp_row][0].split("/")[0])
+        row_num = self.today_row_num
+        while row_num >= 0 and self.dates[row_num].startswith(month + "/") and self.dates[row_num].endswith(year):
+            for column, score in enumerate(self.rows[row_num]):
+                if score != EMPTY_CELL:
+                    totals[column] += score
+            row_num -= 1
 
-        self.data[self.totals_row_num][1:] = totals
-        self.update_file_with_data()
+        self.totals = totals
+        self.response_cache.invalidate()
+        self.rebuild_leaderboards()
+        self.export_writer.mark_dirty()
@@ -0,0 +1,452 @@
+import os
+import json
+import time
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import List, Dict, Tuple, Optional
+
+from Persistence import atomic_write, durable_append
+
+# Set QOTD_DATABASE to a file name to keep everything in a SQLite database there instead of the JSON files
+DATABASE_FILE_NAME = os.environ.get('QOTD_DATABASE')
+
+QUESTIONS_FILE_NAME = "questions.json"
+QUESTIONS_JOURNAL_FILE_NAME = "questionsJournal.jsonl"
+OLD_QUESTIONS_FILE_NAME = "questionsHistory.json"  # Only read to migrate it into the history segments
+
+# Question history is split into append-only JSON-lines segments, one per month of expire times,
+#   plus a small index of the expire times each segment covers
+OLD_QUESTIONS_DIR_NAME = "questionsHistory"
+OLD_QUESTIONS_INDEX_FILE_NAME = os.path.join(OLD_QUESTIONS_DIR_NAME, "index.json")
+
+# Number of journal records we allow to pile up before folding them back into the questions file
+JOURNAL_COMPACTION_THRESHOLD = 100
+
+# The ledger of score events is the source of truth for scores
+SCORES_LEDGER_FILE_NAME = "scoresLedger.jsonl"
+
+POLLS_FILE_NAME = "polls.json"
+
+# A change to a question, as (ID key, "put", question JSON) or (ID key, "remove", question ID)
+QuestionChange = Tuple[str, str, object]
+
+# Questions used to be saved with their attribute names as keys, e.g. "q_id" rather than "qID".
+# Questions read from files that could be that old go through upgrade_question_json to get the current keys
+LEGACY_QUESTION_KEYS = {
+    "q_id": "qID",
+    "question_text": "questionText",
+    "correct_answers": "correctAnswers",
+    "init_time": "initTime",
+    "publish_time": "publishTime",
+    "expire_time": "expireTime",
+    "just_published": "justPublished",
+    "answered_by": "answeredBy"
+}
+
+
+def upgrade_question_json(q_json: dict) -> dict:
+    return {LEGACY_QUESTION_KEYS.get(key, key): value for key, value in q_json.items()}
+
+
+# Polls were saved the same way, and go through upgrade_poll_json when read from the polls file
+LEGACY_POLL_KEYS = {
+    "p_id": "pID",
+    "poll_question_text": "pollQuestionText",
+    "just_published": "justPublished"
+}
+
+
+def upgrade_poll_json(p_json: dict) -> dict:
+    return {LEGACY_POLL_KEYS.get(key, key): value for key, value in p_json.items()}
+
+
+class Storage(ABC):
+    """
+    Where the keepers keep their data. Keepers hold everything in memory and only come here to load on startup
+        and to save changes.
+    FileStorage is the default, and SqliteStorage keeps everything in one database.
+    Methods that write return roughly how many bytes they wrote, for the keepers' IOCounters
+    """
+
+    # Questions, in the order they were added
+    @abstractmethod
+    def load_questions(self) -> List[dict]:
+        pass
+
+    @abstractmethod
+    def save_question_changes(self, changes: List[QuestionChange]) -> int:
+        pass
+
+    # Whether enough changes have piled up that the questions should be written out in full
+    @abstractmethod
+    def wants_question_snapshot(self) -> bool:
+        pass
+
+    @abstractmethod
+    def write_question_snapshot(self, questions: List[dict]) -> int:
+        pass
+
+    # Expired questions, oldest first
+    @abstractmethod
+    def append_to_history(self, old_questions: List[dict]) -> int:
+        pass
+
+    # Expired questions, newest first. If `since` is given, only questions that expired after then
+    @abstractmethod
+    def read_history(self, since: Optional[float] = None) -> List[dict]:
+        pass
+
+    # Score events in the order they happened, or None if scores have never been saved here
+    @abstractmethod
+    def load_score_events(self) -> Optional[List[dict]]:
+        pass
+
+    @abstractmethod
+    def append_score_events(self, events: List[dict]) -> int:
+        pass
+
+    @abstractmethod
+    def load_polls(self) -> List[dict]:
+        pass
+
+    @abstractmethod
+    def save_polls(self, polls: List[dict]) -> int:
+        pass
+
+
+class FileStorage(Storage):
+    """
+    Questions are a JSON snapshot plus a journal of changes since, history is a directory of monthly segments,
+        scores are a JSON-lines ledger, and polls are one JSON file
+    """
+
+    def __init__(self):
+        self.journal_length: int = 0
+        self.snapshot_needed = False
+        # Loaded the first time the history is used
+        self.history_index: Optional[Dict[str, Dict[str, float]]] = None
+
+    # The questions file is a snapshot, so anything recorded in the journal since then is replayed on top of it
+    def load_questions(self) -> List[dict]:
+        try:
+            with open(QUESTIONS_FILE_NAME) as q_file:
+                snapshot = [upgrade_question_json(q_json) for q_json in json.load(q_file)["questions"]]
+        except IOError:
+            snapshot = []
+
+        # Same keys as the question keeper uses, so replaced questions keep their spot
+        questions_by_key = {q_json["qID"].casefold(): q_json for q_json in snapshot}
+        self.journal_length = 0
+        try:
+            journal = open(QUESTIONS_JOURNAL_FILE_NAME)
+        except IOError:
+            journal = None
+
+        if journal:
+            with journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash in the middle of an append can leave a partial last line. Nothing after it is valid
+                        break
+
+                    self.journal_length += 1
+                    if record["op"] == "put":
+                        questions_by_key[record["question"]["qID"].casefold()] = record["question"]
+                    elif record["op"] == "remove":
+                        questions_by_key.pop(record["qID"].casefold(), None)
+
+        # Fold the journal back into a fresh snapshot once the keeper has loaded everything
+        self.snapshot_needed = True
+        return list(questions_by_key.values())
+
+    def save_question_changes(self, changes: List[QuestionChange]) -> int:
+        lines = []
+        for key, op, item in changes:
+            if op == "put":
+                record = {"op": "put", "question": item}
+            else:
+                record = {"op": "remove", "qID": item}
+            lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+
+        bytes_written = durable_append(QUESTIONS_JOURNAL_FILE_NAME, lines)
+        self.journal_length += len(lines)
+        return bytes_written
+
+    def wants_question_snapshot(self) -> bool:
+        return self.snapshot_needed or self.journal_length >= JOURNAL_COMPACTION_THRESHOLD
+
+    # After a snapshot, the journal can be emptied
+    def write_question_snapshot(self, questions: List[dict]) -> int:
+        bytes_written = atomic_write(QUESTIONS_FILE_NAME,
+                                     lambda q_file: json.dump({"questions": questions}, q_file, indent=4))
+        open(QUESTIONS_JOURNAL_FILE_NAME, 'w').close()
+        self.journal_length = 0
+        self.snapshot_needed = False
+        return bytes_written
+
+    # Segments are named by the month their questions expired in
+    @staticmethod
+    def get_history_segment_name(expire_time: float) -> str:
+        return time.strftime("%Y-%m", time.localtime(expire_time))
+
+    @staticmethod
+    def get_history_segment_file_name(segment: str) -> str:
+        return os.path.join(OLD_QUESTIONS_DIR_NAME, segment + ".jsonl")
+
+    def get_history_index(self) -> Dict[str, Dict[str, float]]:
+        if self.history_index is None:
+            try:
+                with open(OLD_QUESTIONS_INDEX_FILE_NAME) as index_file:
+                    self.history_index = json.load(index_file)["segments"]
+            except IOError:
+                # If not exists, create the history from the old single-file format, if there is one
+                os.makedirs(OLD_QUESTIONS_DIR_NAME, exist_ok=True)
+                self.history_index = {}
+                self.migrate_old_questions_file()
+                self.write_history_index()
+        return self.history_index
+
+    def write_history_index(self) -> int:
+        return atomic_write(OLD_QUESTIONS_INDEX_FILE_NAME,
+                            lambda index_file: json.dump({"segments": self.history_index}, index_file, indent=4))
+
+    def migrate_old_questions_file(self):
+        try:
+            file = open(OLD_QUESTIONS_FILE_NAME)
+        except IOError:
+            return
+
+        with file:
+            old_questions = [upgrade_question_json(q_json) for q_json in json.load(file)["oldQuestions"]]
+
+        # The old file is sorted newer to older, and segments are appended to oldest first
+        self.append_to_history(list(reversed(old_questions)))
+
+    # Returns a segment's questions in the order they were expired
+    @staticmethod
+    def read_history_segment(segment: str) -> List[dict]:
+        old_questions = []
+        with open(FileStorage.get_history_segment_file_name(segment)) as segment_file:
+            for line in segment_file:
+                try:
+                    old_questions.append(upgrade_question_json(json.loads(line)))
+                except ValueError:
+                    # A partial last line from a crash mid-append
+                    break
+        return old_questions
+
+    def append_to_history(self, old_questions: List[dict]) -> int:
+        if not old_questions:
+            return 0
+
+        history_index = self.get_history_index()
+        lines_by_segment: Dict[str, List[str]] = {}
+        for q_json in old_questions:
+            expire_time = q_json.get("expireTime", 0)
+            segment = self.get_history_segment_name(expire_time)
+            lines_by_segment.setdefault(segment, []).append(json.dumps(q_json, separators=(",", ":")) + "\n")
+
+            segment_info = history_index.setdefault(segment, {"first": expire_time, "last": expire_time})
+            segment_info["first"] = min(segment_info["first"], expire_time)
+            segment_info["last"] = max(segment_info["last"], expire_time)
+
+        bytes_written = 0
+        for segment, lines in lines_by_segment.items():
+            bytes_written += durable_append(self.get_history_segment_file_name(segment), lines)
+
+        return bytes_written + self.write_history_index()
+
+    # Only the segments the index says could hold questions expired since then get read
+    def read_history(self, since: Optional[float] = None) -> List[dict]:
+        history_index = self.get_history_index()
+        old_questions = []
+        for segment in sorted(history_index, reverse=True):
+            if since is not None and history_index[segment]["last"] < since:
+                continue
+            # Segments are appended to as questions expire, so reading one backwards goes newer to older
+            # Thus if we hit a question older than `since`, we can stop searching it
+            for q_json in reversed(self.read_history_segment(segment)):
+                if since is not None and q_json["expireTime"] < since:
+                    break
+                old_questions.append(q_json)
+        return old_questions
+
+    def load_score_events(self) -> Optional[List[dict]]:
+        try:
+            ledger = open(SCORES_LEDGER_FILE_NAME)
+        except IOError:
+            return None
+
+        events = []
+        with ledger:
+            for line in ledger:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # A partial last line from a crash mid-append
+                    break
+        return events
+
+    def append_score_events(self, events: List[dict]) -> int:
+        return durable_append(SCORES_LEDGER_FILE_NAME,
+                              [json.dumps(event, separators=(",", ":")) + "\n" for event in events])
+
+    def load_polls(self) -> List[dict]:
+        try:
+            with open(POLLS_FILE_NAME) as p_file:
+                return [upgrade_poll_json(p_json) for p_json in json.load(p_file)["polls"]]
+        except IOError:
+            return []
+
+    def save_polls(self, polls: List[dict]) -> int:
+        return atomic_write(POLLS_FILE_NAME, lambda p_file: json.dump({"polls": polls}, p_file, indent=4))
+
+
+class SqliteStorage(Storage):
+    """
+    Everything in one SQLite database, in WAL mode so saving doesn't hold up reads.
+    Each row keeps the full JSON that the file storage would have written, plus indexed columns to look it up by
+    """
+
+    def __init__(self, database_file_name: str):
+        self.connection = sqlite3.connect(database_file_name)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id_key TEXT PRIMARY KEY,
+                    q_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    json TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS questions_by_user ON questions (user_id);
+
+                CREATE TABLE IF NOT EXISTS old_questions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    q_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    expire_time REAL NOT NULL,
+                    json TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS old_questions_by_id ON old_questions (q_id);
+                CREATE INDEX IF NOT EXISTS old_questions_by_user ON old_questions (user_id);
+                CREATE INDEX IF NOT EXISTS old_questions_by_expire_time ON old_questions (expire_time);
+
+                CREATE TABLE IF NOT EXISTS score_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    type TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    date TEXT,
+                    json TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS score_events_by_user ON score_events (user_id);
+                CREATE INDEX IF NOT EXISTS score_events_by_date ON score_events (date);
+
+                CREATE TABLE IF NOT EXISTS polls (
+                    position INTEGER PRIMARY KEY,
+                    p_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    json TEXT NOT NULL
+                );
+            """)
+
+    def load_questions(self) -> List[dict]:
+        rows = self.connection.execute("SELECT json FROM questions ORDER BY position")
+        return [json.loads(row[0]) for row in rows]
+
+    def save_question_changes(self, changes: List[QuestionChange]) -> int:
+        bytes_written = 0
+        with self.connection:
+            for key, op, item in changes:
+                if op == "put":
+                    q_json = json.dumps(item, separators=(",", ":"))
+                    bytes_written += len(q_json.encode())
+                    # Replacing a question keeps its position, and new questions go at the end
+                    self.connection.execute("""
+                        INSERT INTO questions (id_key, q_id, user_id, position, json)
+                        VALUES (?, ?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM questions), ?)
+                        ON CONFLICT (id_key) DO UPDATE SET q_id = excluded.q_id, user_id = excluded.user_id,
+                            json = excluded.json
+                    """, (key, item["qID"], item["user_id"], q_json))
+                else:
+                    self.connection.execute("DELETE FROM questions WHERE id_key = ?", (key,))
+        return bytes_written
+
+    # Changes are saved in place, so there's never anything to fold in
+    def wants_question_snapshot(self) -> bool:
+        return False
+
+    def write_question_snapshot(self, questions: List[dict]) -> int:
+        questions = [upgrade_question_json(q_json) for q_json in questions]
+        rows = [(q_json["qID"].casefold(), q_json["qID"], q_json["user_id"], position,
+                 json.dumps(q_json, separators=(",", ":"))) for position, q_json in enumerate(questions)]
+        with self.connection:
+            self.connection.execute("DELETE FROM questions")
+            self.connection.executemany(
+                "INSERT INTO questions (id_key, q_id, user_id, position, json) VALUES (?, ?, ?, ?, ?)", rows)
+        return sum([len(row[4].encode()) for row in rows])
+
+    def append_to_history(self, old_questions: List[dict]) -> int:
+        old_questions = [upgrade_question_json(q_json) for q_json in old_questions]
+        rows = [(q_json["qID"], q_json["user_id"], q_json.get("expireTime", 0),
+                 json.dumps(q_json, separators=(",", ":"))) for q_json in old_questions]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO old_questions (q_id, user_id, expire_time, json) VALUES (?, ?, ?, ?)", rows)
+        return sum([len(row[3].encode()) for row in rows])
+
+    def read_history(self, since: Optional[float] = None) -> List[dict]:
+        if since is None:
+            rows = self.connection.execute("SELECT json FROM old_questions ORDER BY id DESC")
+        else:
+            rows = self.connection.execute(
+                "SELECT json FROM old_questions WHERE expire_time >= ? ORDER BY id DESC", (since,))
+        return [json.loads(row[0]) for row in rows]
+
+    def load_score_events(self) -> Optional[List[dict]]:
+        rows = self.connection.execute("SELECT json FROM score_events ORDER BY id").fetchall()
+        if not rows:
+            return None
+        return [json.loads(row[0]) for row in rows]
+
+    def append_score_events(self, events: List[dict]) -> int:
+        rows = [(event["type"], event.get("user", ""), event.get("date"), json.dumps(event, separators=(",", ":")))
+                for event in events]
+        with self.connection:
+            self.connection.executemany("INSERT INTO score_events (type, user_id, date, json) VALUES (?, ?, ?, ?)",
+                                        rows)
+        return sum([len(row[3].encode()) for row in rows])
+
+    def load_polls(self) -> List[dict]:
+        rows = self.connection.execute("SELECT json FROM polls ORDER BY position")
+        return [json.loads(row[0]) for row in rows]
+
+    # There are only ever a few polls, so they're all saved together, like the polls file
+    def save_polls(self, polls: List[dict]) -> int:
+        polls = [upgrade_poll_json(p_json) for p_json in polls]
+        rows = [(position, p_json["pID"], p_json["user_id"], json.dumps(p_json, separators=(",", ":")))
+                for position, p_json in enumerate(polls)]
+        with self.connection:
+            self.connection.execute("DELETE FROM polls")
+            self.connection.executemany("INSERT INTO polls (position, p_id, user_id, json) VALUES (?, ?, ?, ?)", rows)
+        return sum([len(row[3].encode()) for row in rows])
+
+    # Whether anything at all has been saved here yet
+    def has_data(self) -> bool:
+        for table in ["questions", "old_questions", "score_events", "polls"]:
+            if self.connection.execute("SELECT 1 FROM " + table + " LIMIT 1").fetchone():
+                return True
+        return False
+
+    def close(self):
+        self.connection.close()
+
+
+# The storage the bot runs with, per QOTD_DATABASE
+def open_storage() -> Storage:
+    if DATABASE_FILE_NAME:
+        return SqliteStorage(DATABASE_FILE_NAME)
+    return FileStorage()
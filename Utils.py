@@ -1,4 +1,8 @@
-from typing import List
+import math
+import time
+import functools
+from collections import deque, OrderedDict
+from typing import List, Dict, Callable
 
 
 def ignore_unused_args(*args):
@@ -7,3 +11,82 @@ def ignore_unused_args(*args):
 
 def chunkify_text(string: str, max_chunk_size: int) -> List[str]:
     return [string[i:i + max_chunk_size] for i in range(0, len(string), max_chunk_size)]
+
+
+# Nearest-rank percentile of an already sorted list, with fraction between 0 and 1
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(int(math.ceil(fraction * len(sorted_values))) - 1, 0)
+    return sorted_values[rank]
+
+
+class IOCounter:
+    """How much a keeper has written to disk, and how long it spent doing it"""
+
+    def __init__(self):
+        self.bytes_written = 0
+        self.seconds = 0.0
+        self.depth = 0  # So nested timed_io calls only get timed once
+
+
+# Decorator for keeper methods that write files. The keeper needs an IOCounter in self.io
+def timed_io(func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        self.io.depth += 1
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.io.depth -= 1
+            if self.io.depth == 0:
+                self.io.seconds += time.perf_counter() - start
+    return wrapper
+
+
+class RollingHistogram:
+    """Keeps the most recent samples of some measurement, for percentiles, and a count of all samples ever added"""
+
+    def __init__(self, max_samples: int = 1000):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+
+    def percentiles(self, fractions: List[float]) -> Dict[float, float]:
+        sorted_samples = sorted(self.samples)
+        return {fraction: percentile(sorted_samples, fraction) for fraction in fractions}
+
+
+class ResponseCache:
+    """
+    Least-recently-used cache of responses to read-only commands.
+    Keepers invalidate it whenever their state changes, so anything rendered before a change is never reused after it
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # `key` should hold anything else the response depends on, like who's asking
+    def get(self, command: str, render: Callable[[], str], *key) -> str:
+        key = (command,) + key
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        self.misses += 1
+        response = render()
+        self.entries[key] = response
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return response
+
+    def invalidate(self):
+        self.entries.clear()
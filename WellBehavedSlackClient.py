@@ -2,8 +2,14 @@ import time
 import json
 import os
 import re
+import random
+import queue
+import threading
 from slackclient import SlackClient
-from typing import List, Optional, Callable
+from Metrics import *
+from Persistence import atomic_write
+from Utils import RollingHistogram
+from typing import List, Dict, Tuple, Optional, Callable, Iterator
 
 # instantiate Slack client
 SLACK_BOT_TOKEN = os.environ.get('SLACK_BOT_TOKEN')
@@ -28,6 +34,47 @@ LOG_FILE = "log.txt"
 FILE_LOGGING = False
 
 USER_LIST_FILE = "userList.json"
+DIRECT_CHANNELS_FILE = "directChannels.json"
+
+# How long to remember names looked up with users.info, in seconds.
+# Failed lookups are remembered too, so unknown IDs don't keep costing API calls
+NAME_LOOKUP_TTL = 60 * 60 * 24
+FAILED_NAME_LOOKUP_TTL = 60 * 10
+
+# Web API rate limits, as (requests per second, burst size), roughly following Slack's rate limit tiers.
+# Methods not listed here get DEFAULT_RATE_LIMIT
+METHOD_RATE_LIMITS = {
+    "chat.postMessage": (1.0, 1),  # Special tier: about one message per second
+    "reactions.add": (50 / 60, 3),  # Tier 3
+    "conversations.open": (50 / 60, 3),  # Tier 3
+    "users.info": (100 / 60, 5),  # Tier 4
+    "users.list": (20 / 60, 1),  # Tier 2
+    "auth.test": (100 / 60, 5)  # Special tier, but generous
+}
+DEFAULT_RATE_LIMIT = (20 / 60, 1)  # Tier 2
+
+# Failed API calls are retried up to API_RETRY_BUDGET times in total, waiting a random time of up to
+#   API_BACKOFF_BASE * 2^attempt seconds (capped at API_BACKOFF_MAX) in between, or however long Slack says to wait.
+# After CIRCUIT_FAILURE_THRESHOLD calls in a row fail, API calls fail immediately for CIRCUIT_RESET_TIMEOUT seconds
+API_RETRY_BUDGET = 5
+API_BACKOFF_BASE = 1.0
+API_BACKOFF_MAX = 60.0
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30.0
+
+# auth.test errors that mean the token is bad, as opposed to Slack being unreachable for a while.
+# Otherwise, startup waits AUTH_RETRY_DELAY seconds between tries until auth.test works
+FATAL_AUTH_ERRORS = ["not_authed", "invalid_auth", "account_inactive", "token_revoked", "token_expired"]
+AUTH_RETRY_DELAY = 3
+
+# Messages are held in the outbound queue for at least this many seconds, and anything else said to the same channel
+#   before they're sent gets merged into the same post. 0 turns this off. Only works with the outbound queue.
+# Set MESSAGE_COALESCE_SECONDS to turn it on
+MESSAGE_COALESCE_WINDOW = float(os.environ.get('MESSAGE_COALESCE_SECONDS', 0))
+MAX_MESSAGE_LENGTH = 40000  # Slack truncates messages longer than this
+
+# On shutdown, how long to keep sending what's left in the outbound queue before giving up on it
+OUTBOUND_SHUTDOWN_TIMEOUT = 30.0
 
 WELCOME_MESSAGE = "I'm QOTD Bot, and I help with the the question of the day channel. I keep track of user-submitted " \
                   "questions, check answers, and keep score. You can talk to me by starting a private chat with " \
@@ -36,59 +83,290 @@ WELCOME_MESSAGE = "I'm QOTD Bot, and I help with the the question of the day cha
                   "have any questions! "
 
 
+class TokenBucket:
+    """Allows bursts of up to `capacity` calls, refilled at `rate` calls per second"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last_refill = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Waits for a token to be available and takes it. Returns the number of seconds spent waiting"""
+        waited = 0.0
+        with self.lock:
+            while True:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+                time.sleep(wait_time)
+                waited += wait_time
+
+
+class CircuitBreaker:
+    """
+    Stops API calls from being attempted for a while once enough of them fail in a row.
+    When that time is up, one call is let through to test the waters: if it fails, the wait starts over
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        return self.consecutive_failures >= self.failure_threshold
+
+    def allow(self) -> bool:
+        with self.lock:
+            if not self.is_open():
+                return True
+            if time.time() < self.open_until or self.trial_in_progress:
+                return False
+            self.trial_in_progress = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.trial_in_progress = False
+            if self.is_open():
+                self.open_until = time.time() + self.reset_timeout
+
+
+class OutboundCall:
+    """A say or react waiting in the outbound queue"""
+
+    def __init__(self, method: str, kwargs: dict, description: str):
+        self.method = method
+        self.kwargs = kwargs
+        self.description = description
+        self.enqueue_time = time.time()
+        self.send_after = self.enqueue_time
+
+
 class WellBehavedSlackClient(SlackClient):
-    """Slack client with rate limit"""
+    """
+    Slack client with rate limits.
+    Messages and reactions go through a queue that a background thread sends from,
+        so the bot never waits on rate limits while handling commands
+    """
 
-    def __init__(self, token, proxies=None, rate_limit=1.0):
+    def __init__(self, token, proxies=None, async_outbound=True, coalesce_window=MESSAGE_COALESCE_WINDOW):
         super().__init__(token, proxies)
-        self.rate_limit = rate_limit
-        self.last_invoked = time.time() - rate_limit
-
+        self.rate_limiters: Dict[str, TokenBucket] = {}
+        self.circuit_breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+
+        # Outbound queue, plus some numbers on how it's keeping up
+        self.outbound_queue: queue.Queue = queue.Queue()
+        self.outbound_sent = 0
+        self.outbound_latency_total = 0.0
+        self.outbound_latency_max = 0.0
+        self.outbound_latencies = RollingHistogram()  # Recent latencies, for percentiles
+        self.async_outbound = async_outbound
+
+        # Channel -> the queued message that new messages to that channel can still be merged into
+        self.coalesce_window = coalesce_window if async_outbound else 0.0
+        self.open_messages: Dict[str, OutboundCall] = {}
+        self.open_messages_lock = threading.Lock()
+
+        # Time spent in API calls and queueing by anything other than the outbound thread,
+        #   i.e. how long command handling had to wait on Slack
+        self.foreground_api_seconds = 0.0
+
+        self.outbound_thread: Optional[threading.Thread] = None
+        if async_outbound:
+            self.outbound_thread = threading.Thread(target=self.send_outbound_forever, name="outbound", daemon=True)
+            self.outbound_thread.start()
+
+        # In-memory copy of USER_LIST_FILE, reloaded only when the file changes
+        self.user_names: Dict[str, str] = {}
+        self.user_list_mtime: Optional[float] = None
+        # users.info results, as user ID -> (name, time to forget it)
+        self.name_lookups: Dict[str, Tuple[str, float]] = {}
+
+        # User ID -> ID of our direct message channel with them
+        self.direct_channels: Dict[str, str] = {}
+        self.load_direct_channels()
+
+    def get_rate_limiter(self, method: str) -> TokenBucket:
+        if method not in self.rate_limiters:
+            rate, capacity = METHOD_RATE_LIMITS.get(method, DEFAULT_RATE_LIMIT)
+            self.rate_limiters[method] = TokenBucket(rate, capacity)
+        return self.rate_limiters[method]
+
+    # Makes an API call, retrying with backoff if it can't connect or gets rate limited.
+    # If it can't get through, this returns an error response like Slack's, {"ok": False, "error": ...},
+    #   rather than raising
     def api_call(self, method: str, timeout=None, **kwargs):
-        while True:
-            now = time.time()
-            if (now - self.last_invoked) >= self.rate_limit:
-                try:
-                    result = super().api_call(method, timeout=timeout, **kwargs)
-                except BaseException as e:
-                    print("Connection Error. Retrying in 3 seconds...")
-                    print("Exception details: " + str(e))
-                    time.sleep(3)
-                    continue
-                self.last_invoked = time.time()
-                return result
+        start = time.perf_counter()
+        try:
+            return self.api_call_with_retries(method, timeout, **kwargs)
+        finally:
+            if threading.current_thread() is not self.outbound_thread:
+                self.foreground_api_seconds += time.perf_counter() - start
+
+    def api_call_with_retries(self, method: str, timeout=None, **kwargs):
+        if not self.circuit_breaker.allow():
+            return {"ok": False, "error": "circuit_open"}
+
+        result = {"ok": False, "error": "connection_error"}
+        for attempt in range(API_RETRY_BUDGET):
+            waited = self.get_rate_limiter(method).acquire()
+            if waited:
+                metrics.inc("qotd_rate_limit_sleep_seconds_total", waited, method=method)
+            metrics.inc("qotd_api_calls_total", method=method)
+            try:
+                result = super().api_call(method, timeout=timeout, **kwargs)
+            except Exception as e:
+                print("Connection Error on " + method + ".")
+                print("Exception details: " + str(e))
+                result = {"ok": False, "error": "connection_error"}
+                retry_after = None
             else:
-                time.sleep(self.rate_limit - (now - self.last_invoked))
+                if result.get("error") != "ratelimited":
+                    self.circuit_breaker.record_success()
+                    return result
+                print("Rate limited on " + method + ".")
+                retry_after = self.get_retry_after(result)
+
+            if attempt == API_RETRY_BUDGET - 1:
+                break
+            if retry_after is None:
+                retry_after = random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt))
+            print("Retrying in " + str(round(retry_after, 1)) + " seconds...")
+            time.sleep(retry_after)
+
+        self.circuit_breaker.record_failure()
+        return result
+
+    # slackclient puts the HTTP response headers in the result, which is where Slack says how long to back off
+    @staticmethod
+    def get_retry_after(result: dict) -> Optional[float]:
+        headers = {key.lower(): value for key, value in result.get("headers", {}).items()}
+        try:
+            return float(headers["retry-after"])
+        except (KeyError, ValueError):
+            return None
+
+    # Sends outbound calls in the order they were queued, which also keeps each channel's messages in order
+    def send_outbound_forever(self):
+        while True:
+            call = self.outbound_queue.get()
+            try:
+                # Hold messages until their coalescing window is over, then close them to merging
+                wait_time = call.send_after - time.time()
+                if wait_time > 0:
+                    time.sleep(wait_time)
+                with self.open_messages_lock:
+                    if self.open_messages.get(call.kwargs.get("channel")) is call:
+                        del self.open_messages[call.kwargs["channel"]]
+
+                self.send_outbound(call)
+            except Exception as e:
+                log("Outbound " + call.method + " failed: " + str(e) + "\n")
+            finally:
+                self.outbound_queue.task_done()
+
+    def send_outbound(self, call: OutboundCall):
+        try:
+            result = self.api_call(call.method, **call.kwargs)
+        except ValueError:
+            result = {"ok": False, "error": "bad request"}
+        if result.get("ok"):
+            log("QOTD Bot " + call.description + "\n")
+        else:
+            log("QOTD Bot failed (" + str(result.get("error")) + ") to " + call.description + "\n")
+
+        latency = time.time() - call.enqueue_time
+        self.outbound_sent += 1
+        self.outbound_latency_total += latency
+        self.outbound_latency_max = max(self.outbound_latency_max, latency)
+        self.outbound_latencies.add(latency)
+
+    def queue_outbound(self, call: OutboundCall):
+        if self.async_outbound:
+            start = time.perf_counter()
+            self.outbound_queue.put(call)
+            self.foreground_api_seconds += time.perf_counter() - start
+        else:
+            self.send_outbound(call)
+
+    # Blocks until everything queued so far has been sent, or until `timeout` seconds have gone by.
+    # Used when shutting down, since the outbound thread dies with the bot. Returns whether everything got sent
+    def flush_outbound(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.time() + timeout
+        with self.outbound_queue.all_tasks_done:
+            while self.outbound_queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    print("Gave up on sending " + str(self.outbound_queue.unfinished_tasks) + " outbound calls")
+                    return False
+                self.outbound_queue.all_tasks_done.wait(remaining)
+        return True
+
+    # Latencies are in seconds, from being queued to being sent
+    def get_outbound_stats(self) -> Dict[str, float]:
+        percentiles = self.outbound_latencies.percentiles([0.5, 0.95, 0.99])
+        return {
+            "queue_depth": self.outbound_queue.qsize(),
+            "sent": self.outbound_sent,
+            "average_latency": (self.outbound_latency_total / self.outbound_sent) if self.outbound_sent else 0.0,
+            "p50_latency": percentiles[0.5],
+            "p95_latency": percentiles[0.95],
+            "p99_latency": percentiles[0.99],
+            "max_latency": self.outbound_latency_max
+        }
 
     # Use this to post a message to a channel
     def say(self, channel: str, response: str):
         if channel == "" or channel == "DEPLOY_CHANNEL":
             channel = DEPLOY_CHANNEL
-        try:
-            self.api_call(
-                "chat.postMessage",
-                channel=channel,
-                text=response,
-                icon_emoji=':robot_face:'
-            )
-            log("QOTD Bot says: " + (response if response else "[BLANK MESSAGE]") + "\n")
-        except ValueError:
-            log("QOTD Bot failed to say: " + (response if response else "[BLANK MESSAGE]") + "\n")
+
+        # Merging goes into the held message's spot in the queue. So a message merged in gets sent ahead of any
+        #   reactions queued between it and the held message, even ones in the same channel
+        if self.coalesce_window > 0:
+            with self.open_messages_lock:
+                call = self.open_messages.get(channel)
+                if call and len(call.kwargs["text"]) + len(response) + 1 <= MAX_MESSAGE_LENGTH:
+                    call.kwargs["text"] += "\n" + response
+                    call.description = "says: " + call.kwargs["text"]
+                    return
+
+        call = OutboundCall(
+            "chat.postMessage",
+            {"channel": channel, "text": response, "icon_emoji": ':robot_face:'},
+            "says: " + (response if response else "[BLANK MESSAGE]")
+        )
+        if self.coalesce_window > 0:
+            call.send_after = call.enqueue_time + self.coalesce_window
+            with self.open_messages_lock:
+                self.open_messages[channel] = call
+        self.queue_outbound(call)
 
     # Use this to add an emoji reaction to a message.
     # The timestamp can easily come from the command message, if that's what you're reacting to.
     # Reacting to older messages requires more effort to hang on to the timestamp, because we can't retrieve it later.
     def react(self, channel: str, timestamp: str, emoji: str):
-        try:
-            self.api_call(
-                "reactions.add",
-                channel=channel,
-                timestamp=timestamp,
-                name=emoji
-            )
-            log("QOTD Bot reacts with: " + (emoji if emoji else "[NO EMOJI]") + "\n")
-        except ValueError:
-            log("QOTD Bot failed to react with: " + (emoji if emoji else "[NO EMOJI]") + "\n")
+        self.queue_outbound(OutboundCall(
+            "reactions.add",
+            {"channel": channel, "timestamp": timestamp, "name": emoji},
+            "reacts with: " + (emoji if emoji else "[NO EMOJI]")
+        ))
 
     # Send an action log to the chosen dev.
     # This is currently used to send exception details + stacktrace directly to the dev when an error is caught
@@ -103,14 +381,35 @@ class WellBehavedSlackClient(SlackClient):
     # If we want to send a message to a user,
     #   and the command in question wasn't sent in that user's private channel
     #   we can use an API call to open a conversation / retrieve a channel ID.
-    # In the future we should cache this info to speed up response time
+    # Channels are cached (and saved to a file), and most get picked up from messages users send us,
+    #   so usually no API call is needed
     def get_direct_channel(self, user_id: str) -> str:
+        if user_id in self.direct_channels:
+            return self.direct_channels[user_id]
+
         dm_channel = self.api_call(
             "conversations.open",
             users=user_id
         )
+        if not dm_channel.get("ok"):
+            raise ConnectionError("Couldn't open a direct channel with " + user_id + ": " + str(dm_channel.get("error")))
+        self.remember_direct_channel(user_id, dm_channel["channel"]["id"])
         return dm_channel["channel"]["id"]
 
+    def remember_direct_channel(self, user_id: str, channel: str):
+        if self.direct_channels.get(user_id) == channel:
+            return
+        self.direct_channels[user_id] = channel
+
+        atomic_write(DIRECT_CHANNELS_FILE, lambda channels_file: json.dump(self.direct_channels, channels_file, indent=4))
+
+    def load_direct_channels(self):
+        try:
+            with open(DIRECT_CHANNELS_FILE) as channels_file:
+                self.direct_channels = json.load(channels_file)
+        except IOError:
+            self.direct_channels = {}
+
     def get_name_by_id(self, user_id: str) -> str:
         # All Slack user IDs start with "U", by convention
         # So this is an easy check for invalid names
@@ -125,12 +424,15 @@ class WellBehavedSlackClient(SlackClient):
         #     return userName
 
         # Next highest priority is to use the bulk list of all users we can manually pull from Slack
-        with open(USER_LIST_FILE) as usersFile:
-            users_dict = json.load(usersFile)
+        users_dict = self.get_user_names()
         if user_id in users_dict:
             user_name = users_dict[user_id]
             return user_name
 
+        now = time.time()
+        if user_id in self.name_lookups and self.name_lookups[user_id][1] > now:
+            return self.name_lookups[user_id][0]
+
         # Last ditch effort is to do an api call, which we really want to avoid
         attempted_name_json = self.api_call(
             "users.info",
@@ -142,33 +444,55 @@ class WellBehavedSlackClient(SlackClient):
                 user_name = attempted_name_json["user"]["profile"]["display_name"]
             else:
                 user_name = attempted_name_json["user"]["profile"]["real_name"]
+            self.name_lookups[user_id] = (user_name, now + NAME_LOOKUP_TTL)
         else:
             user_name = user_id
+            self.name_lookups[user_id] = (user_name, now + FAILED_NAME_LOOKUP_TTL)
 
         return user_name
 
-    def parse_bot_commands(self, slack_events: List[dict]) -> Optional[dict]:
+    # Gets the cached user list, reading USER_LIST_FILE again only if it's been modified since the last read
+    def get_user_names(self) -> Dict[str, str]:
+        try:
+            mtime = os.path.getmtime(USER_LIST_FILE)
+        except OSError:
+            return self.user_names
+
+        if mtime != self.user_list_mtime:
+            with open(USER_LIST_FILE) as users_file:
+                self.user_names = json.load(users_file)
+            self.user_list_mtime = mtime
+        return self.user_names
+
+    # Called after the user list is pulled from Slack again, so we don't have to re-read the file we just wrote
+    def set_user_names(self, users_dict: Dict[str, str]):
+        self.user_names = users_dict
+        self.user_list_mtime = os.path.getmtime(USER_LIST_FILE)
+        self.name_lookups = {}
+
+    def parse_bot_commands(self, slack_events: List[dict]) -> Iterator[dict]:
         """
         Parses a list of events coming from the Slack RTM API to find bot commands.
-        If a bot command is found, this function returns a tuple of command and channel.
-        If its not found, then this function returns None, None.
+        Yields every bot command event in the list, in order.
         """
         for event in slack_events:
+            metrics.inc("qotd_events_received_total", type=event.get("type", "unknown"))
             if event["type"] == "goodbye":
                 print("Got 'goodbye' message. Reconnecting now")
                 self.rtm_connect(with_team_state=False)
             if event["type"] == "error":
                 print("Network error. Retrying in 5 seconds...\n")
                 time.sleep(5)
-                return None
+                return
             if event["type"] == "member_joined_channel" and event["channel"] == QOTD_CHANNEL:
                 self.say(QOTD_CHANNEL, "Welcome " + get_reference_by_id(event["user"]) + "! " + WELCOME_MESSAGE)
             if event["type"] == "message" and "subtype" not in event:
+                if is_event_private(event) and "user" in event and event["user"] != bot_id:
+                    self.remember_direct_channel(event["user"], event["channel"])
                 processed_event = self.parse_direct_mention(event)
                 if processed_event:
                     log(self.get_name_by_id(event["user"]) + " says: " + event["text"] + "\n")
-                    return processed_event
-        return None
+                    yield processed_event
 
     @staticmethod
     def parse_direct_mention(event: dict) -> Optional[dict]:
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+from typing import Dict, List, Tuple
+from unittest import mock
+
+import QOTDBot as Qb
+import WellBehavedSlackClient as Wbsc
+
+
+class FakeWebAPI:
+    """
+    Stands in for Slack's Web API underneath WellBehavedSlackClient, so the client's own retrying, rate limiting
+        and queueing all run for real.
+    Responses can be queued up per method, as Slack-style result dicts or exceptions to raise.
+    Methods with nothing queued get a plain successful response
+    """
+
+    DEFAULT_RESPONSES = {
+        "auth.test": {"ok": True, "user_id": "UBOT"},
+        "users.list": {"ok": True, "members": []},
+        "users.info": {"ok": False, "error": "user_not_found"},
+        "conversations.open": {"ok": True, "channel": {"id": "DNEW"}}
+    }
+
+    def __init__(self):
+        self.calls: List[Tuple[str, dict]] = []
+        self.queued_responses: Dict[str, list] = {}
+        self.patcher = mock.patch.object(Wbsc.SlackClient, "api_call",
+                                         lambda client, method, timeout=None, **kwargs: self.api_call(method, **kwargs))
+
+    def __enter__(self):
+        self.patcher.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.patcher.stop()
+
+    def queue(self, method: str, *responses):
+        self.queued_responses.setdefault(method, []).extend(responses)
+
+    def api_call(self, method: str, **kwargs) -> dict:
+        self.calls.append((method, kwargs))
+        if self.queued_responses.get(method):
+            response = self.queued_responses[method].pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return dict(self.DEFAULT_RESPONSES.get(method, {"ok": True}))
+
+    def get_calls(self, method: str) -> List[dict]:
+        return [kwargs for called_method, kwargs in self.calls if called_method == method]
+
+    # (channel, text) of every message posted, in order
+    def get_posts(self) -> List[Tuple[str, str]]:
+        return [(kwargs["channel"], kwargs["text"]) for kwargs in self.get_calls("chat.postMessage")]
+
+
+class DataDirectory:
+    """Runs a test in an empty temporary directory, so the keepers' files don't touch anything real"""
+
+    def __enter__(self):
+        self.original_directory = os.getcwd()
+        self.temp_directory = tempfile.TemporaryDirectory(prefix="qotd-test-")
+        os.chdir(self.temp_directory.name)
+        return self.temp_directory.name
+
+    def __exit__(self, *exc_info):
+        os.chdir(self.original_directory)
+        self.temp_directory.cleanup()
+
+
+class FakeSlackTestCase(unittest.TestCase):
+    """
+    Runs each test in its own data directory, against a fake Web API with no rate limit on posting messages.
+    Everything is cleaned up even if a subclass's setUp fails partway
+    """
+
+    def setUp(self):
+        self.data_directory = self.enter_context(DataDirectory())
+        self.web_api = self.enter_context(FakeWebAPI())
+        # Rate limits are tested on their own, and would otherwise make every message after the first wait a second
+        self.enter_context(mock.patch.dict(Wbsc.METHOD_RATE_LIMITS, {"chat.postMessage": (1000.0, 1000)}))
+
+    # Enters a context manager for the rest of the test, like TestCase.enterContext does from Python 3.11 on
+    def enter_context(self, context_manager):
+        result = context_manager.__enter__()
+        self.addCleanup(context_manager.__exit__, None, None, None)
+        return result
+
+
+def message(channel: str, text: str, user: str = "U00000001") -> dict:
+    return {"type": "message", "user": user, "channel": channel, "text": text, "ts": "1"}
+
+
+class BotTestCase(FakeSlackTestCase):
+    """Runs each test against a freshly started bot, with messages sent to it as if they'd come in over RTM"""
+
+    def setUp(self):
+        super().setUp()
+        Qb.slack_client = Qb.WellBehavedSlackClient("xoxb-test", async_outbound=False)
+        Qb.slack_client.set_bot_id("UBOT")
+        Qb.question_keeper = Qb.QuestionKeeper()
+        Qb.score_keeper = Qb.ScoreKeeper(Qb.slack_client)
+        Qb.command_keeper = Qb.CommandKeeper()
+        Qb.poll_keeper = Qb.PollKeeper()
+        self.addCleanup(Qb.flush_all_writers)
+
+    def read_batch(self, events: list) -> list:
+        Qb.slack_client.rtm_read = lambda: events
+        return Qb.read_bot_commands()
+
+    def send(self, *events: dict):
+        Qb.handle_bot_commands(self.read_batch(list(events)))
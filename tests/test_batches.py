@@ -0,0 +1,46 @@
+import unittest
+
+import QOTDBot as Qb
+from tests.fake_slack import BotTestCase, message
+
+
+class RtmBatchTest(BotTestCase):
+    """Every command in a single rtm_read batch gets handled, in the order it came in"""
+
+    def test_every_command_in_a_batch_is_handled_in_order(self):
+        batch = [
+            message("D00000001", "question q1 What is one plus one? : two"),
+            {"type": "user_typing", "channel": "D00000001", "user": "U00000001"},
+            message("D00000001", "question q2 What is two plus two? : four"),
+            message(Qb.QOTD_CHANNEL, "chatter that isn't meant for the bot"),
+            message("D00000001", "publish q2"),
+            message(Qb.QOTD_CHANNEL, "<@UBOT> questions", user="U00000002"),
+            message("D00000001", "my-questions")
+        ]
+
+        parsed_events = self.read_batch(batch)
+        self.assertEqual(["question q1 What is one plus one? : two", "question q2 What is two plus two? : four",
+                          "publish q2", "questions", "my-questions"],
+                         [event["text"] for event in parsed_events])
+
+        Qb.handle_bot_commands(parsed_events)
+
+        posts = self.web_api.get_posts()
+        self.assertEqual(["D00000001", "D00000001", Qb.DEPLOY_CHANNEL, "D00000001", Qb.QOTD_CHANNEL, "D00000001"],
+                         [channel for channel, text in posts])
+        self.assertIn("q1", posts[0][1])
+        self.assertIn("q2", posts[1][1])
+        self.assertIn("What is two plus two?", posts[2][1])  # The "New questions" announcement from publishing
+        self.assertIn("q2", posts[3][1])
+        self.assertIn("What is two plus two?", posts[4][1])
+        self.assertNotIn("What is one plus one?", posts[4][1])  # Not published, so not listed
+        self.assertLess(posts[5][1].index("q1"), posts[5][1].index("q2"))
+
+    def test_empty_batch(self):
+        self.assertEqual([], self.read_batch([]))
+        Qb.handle_bot_commands([])
+        self.assertEqual([], self.web_api.get_posts())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+import WellBehavedSlackClient as Wbsc
+from tests.fake_slack import FakeSlackTestCase
+
+
+class OutboundQueueTest(FakeSlackTestCase):
+    def test_flush_sends_everything_queued_including_held_messages(self):
+        client = Wbsc.WellBehavedSlackClient("xoxb-test", coalesce_window=0.2)
+        client.say("C1", "first")
+        client.say("C1", "second")
+        client.say("C2", "other channel")
+        client.react("C1", "1.0", "thumbsup")
+
+        self.assertTrue(client.flush_outbound(timeout=5))
+        self.assertEqual([("C1", "first\nsecond"), ("C2", "other channel")], self.web_api.get_posts())
+        self.assertEqual(1, len(self.web_api.get_calls("reactions.add")))
+
+        stats = client.get_outbound_stats()
+        self.assertEqual(0, stats["queue_depth"])
+        self.assertEqual(3, stats["sent"])
+        # Merged messages were held for the coalescing window before going out
+        self.assertGreaterEqual(stats["max_latency"], 0.2)
+        self.assertLessEqual(stats["p50_latency"], stats["max_latency"])
+
+    def test_flush_gives_up_after_timeout(self):
+        client = Wbsc.WellBehavedSlackClient("xoxb-test", coalesce_window=10)
+        client.say("C1", "held for a long time")
+
+        self.assertFalse(client.flush_outbound(timeout=0.1))
+        self.assertEqual([], self.web_api.get_posts())
+
+    def test_synchronous_client_has_nothing_to_flush(self):
+        client = Wbsc.WellBehavedSlackClient("xoxb-test", async_outbound=False)
+        client.say("C1", "sent right away")
+
+        self.assertTrue(client.flush_outbound(timeout=0))
+        self.assertEqual([("C1", "sent right away")], self.web_api.get_posts())
+
+
+if __name__ == "__main__":
+    unittest.main()
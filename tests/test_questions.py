@@ -0,0 +1,124 @@
+import random
+import unittest
+
+import Storage
+from QuestionKeeper import QuestionKeeper
+from Storage import FileStorage
+from tests.fake_slack import FakeSlackTestCase
+
+
+class QuestionJournalTest(FakeSlackTestCase):
+    """The questions file plus the journal replayed on top of it always add up to what the keeper has in memory"""
+
+    def setUp(self):
+        super().setUp()
+        self.keeper = QuestionKeeper()
+
+    def save(self):
+        self.keeper.journal_writer.flush()
+
+    def get_saved_questions(self) -> list:
+        return FileStorage().load_questions()
+
+    def get_questions(self) -> list:
+        return [q.to_json() for q in self.keeper.questions_by_id.values()]
+
+    def test_journal_replays_to_the_same_questions(self):
+        self.keeper.add_question("U1", "first", "Is this first?", ["yes"])
+        self.keeper.add_question("U1", "Second", "Is this second?", ["yes"])
+        self.keeper.add_question("U2", "third", "Is this third?", ["yes"])
+        self.keeper.write_questions_to_file()
+
+        self.keeper.add_answer("U1", "first", "yep")
+        self.keeper.publish_by_id("third")
+        self.keeper.check_answer("U3", "third", "no")
+        self.keeper.remove_question("SECOND", "U1")
+        self.save()
+
+        self.assertEqual(self.get_questions(), self.get_saved_questions())
+        self.assertEqual(["first", "third"], [q_json["qID"] for q_json in self.get_saved_questions()])
+
+    def test_removed_then_re_added_question_goes_last(self):
+        self.keeper.add_question("U1", "first", "Is this first?", ["yes"])
+        self.keeper.add_question("U1", "second", "Is this second?", ["yes"])
+        self.keeper.write_questions_to_file()
+
+        # Both changes land in the same save, and the new question's ID only differs by case
+        self.keeper.remove_question("first", "U1")
+        self.keeper.add_question("U2", "FIRST", "Is this first again?", ["yes"])
+        self.save()
+
+        self.assertEqual(self.get_questions(), self.get_saved_questions())
+        self.assertEqual(["second", "FIRST"], [q_json["qID"] for q_json in self.get_saved_questions()])
+
+    def test_new_questions_keep_their_order_when_changed_before_saving(self):
+        self.keeper.add_question("U1", "first", "Is this first?", ["yes"])
+        self.keeper.add_question("U1", "second", "Is this second?", ["yes"])
+        self.keeper.add_answer("U1", "first", "yep")
+        self.save()
+
+        self.assertEqual(["first", "second"], [q_json["qID"] for q_json in self.get_saved_questions()])
+
+    def test_torn_last_journal_line_is_ignored(self):
+        self.keeper.add_question("U1", "first", "Is this first?", ["yes"])
+        self.save()
+        with open(Storage.QUESTIONS_JOURNAL_FILE_NAME, "a") as journal:
+            journal.write('{"op":"put","question":{"qID":"sec')
+
+        self.assertEqual(self.get_questions(), self.get_saved_questions())
+
+        # Loading folds the journal into a snapshot, so changes saved after the torn line aren't stuck behind it
+        self.keeper = QuestionKeeper()
+        self.keeper.add_question("U1", "second", "Is this second?", ["yes"])
+        self.save()
+        self.assertEqual(["first", "second"], [q_json["qID"] for q_json in self.get_saved_questions()])
+
+    def test_compaction_leaves_questions_unchanged(self):
+        for n in range(Storage.JOURNAL_COMPACTION_THRESHOLD + 1):
+            self.keeper.add_question("U1", "q" + str(n), "Question " + str(n) + "?", ["yes"])
+            self.save()
+
+        # Passing the threshold wrote a snapshot and emptied the journal
+        self.assertLess(self.keeper.storage.journal_length, Storage.JOURNAL_COMPACTION_THRESHOLD)
+        self.assertEqual(self.get_questions(), self.get_saved_questions())
+
+        before = self.get_saved_questions()
+        self.keeper.write_questions_to_file()
+        self.assertEqual(before, self.get_saved_questions())
+        self.assertEqual(before, [q.to_json() for q in QuestionKeeper().questions_by_id.values()])
+
+    def test_random_changes_replay_to_the_same_questions(self):
+        rng = random.Random(7)
+        q_ids = ["alpha", "Alpha", "beta", "GAMMA", "gamma", "delta"]
+        users = ["U1", "U2"]
+
+        for step in range(2000):
+            q_id = rng.choice(q_ids)
+            user_id = rng.choice(users)
+            action = rng.randrange(8)
+            if action == 0:
+                self.keeper.add_question(user_id, q_id, "What is " + q_id + "?", ["it"])
+            elif action == 1:
+                self.keeper.remove_question(q_id, user_id)
+            elif action == 2:
+                self.keeper.add_answer(user_id, q_id, str(step))
+            elif action == 3:
+                self.keeper.publish_by_id(q_id)
+            elif action == 4 and self.keeper.get_question_by_id(q_id):
+                self.keeper.check_answer(rng.choice(["U3", "U4"]), q_id, rng.choice(["it", "not it"]))
+            elif action == 5:
+                self.keeper.first_time_display()
+            elif action == 6:
+                self.save()
+            elif rng.random() < 0.1:
+                self.keeper.write_questions_to_file()
+
+            if action == 6:
+                self.assertEqual(self.get_questions(), self.get_saved_questions(), "step " + str(step))
+
+        self.save()
+        self.assertEqual(self.get_questions(), self.get_saved_questions())
+
+
+if __name__ == "__main__":
+    unittest.main()
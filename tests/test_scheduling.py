@@ -0,0 +1,144 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import QOTDBot as Qb
+from tests.fake_slack import BotTestCase, message
+
+
+class ScheduledTestCase(BotTestCase):
+    """Runs each test on a clock that only moves when the test says so"""
+
+    def setUp(self):
+        super().setUp()
+        self.now = time.time()
+        self.enter_context(mock.patch("time.time", lambda: self.now))
+
+    def wait(self, seconds: float):
+        self.now += seconds
+        Qb.run_scheduled_tasks()
+
+    def restart(self):
+        Qb.flush_all_writers()
+        Qb.question_keeper = Qb.QuestionKeeper()
+
+    def get_announcements(self, heading: str) -> list:
+        return [text for channel, text in self.web_api.get_posts()
+                if channel == Qb.DEPLOY_CHANNEL and text.startswith(heading)]
+
+
+class ScheduledPublishTest(ScheduledTestCase):
+    def setUp(self):
+        super().setUp()
+        self.send(message("D00000001", "question q1 What is one plus one? : two"),
+                  message("D00000001", "question q2 What is two plus two? : four"))
+
+    def test_publish_in(self):
+        self.send(message("D00000001", "publish q1 in 2 hours"))
+
+        self.assertTrue(self.web_api.get_posts()[-1][1].startswith("Okay, I'll publish question q1 on "))
+        self.assertEqual(self.now + 2 * 60 * 60, Qb.question_keeper.get_question_by_id("q1").scheduled_publish_time)
+
+        self.wait(2 * 60 * 60 - 1)
+        self.assertFalse(Qb.question_keeper.get_question_by_id("q1").published)
+        self.assertEqual([], self.get_announcements("New questions"))
+
+        self.wait(1)
+        self.assertTrue(Qb.question_keeper.get_question_by_id("q1").published)
+        self.assertEqual(["New questions:\n(q1): What is one plus one?\n"], self.get_announcements("New questions"))
+
+        # Announced once, and not again by the next publish
+        self.wait(60)
+        self.send(message("D00000001", "publish q2"))
+        self.assertEqual(["New questions:\n(q1): What is one plus one?\n",
+                          "New questions:\n(q2): What is two plus two?\n"], self.get_announcements("New questions"))
+
+    def test_publish_at(self):
+        self.send(message("D00000001", "publish q1 at 2pm"))
+
+        expected = datetime.now().replace(hour=14, minute=0, second=0, microsecond=0)
+        if expected <= datetime.now():
+            expected += timedelta(days=1)
+        self.assertEqual(expected.timestamp(), Qb.question_keeper.get_question_by_id("q1").scheduled_publish_time)
+
+    def test_everything_due_at_once_is_one_announcement(self):
+        self.send(message("D00000001", "publish in 30m"))
+        self.assertEqual("Okay, I'll publish your 2 unpublished questions on " + Qb.format_publish_time(self.now + 1800)
+                         + ".\n", self.web_api.get_posts()[-1][1])
+
+        self.wait(30 * 60)
+        self.assertEqual(["New questions:\n(q1): What is one plus one?\n(q2): What is two plus two?\n"],
+                         self.get_announcements("New questions"))
+
+    def test_scheduled_publish_survives_a_restart(self):
+        self.send(message("D00000001", "publish q2 in 1h"))
+        self.restart()
+
+        self.wait(60 * 60)
+        self.assertTrue(Qb.question_keeper.get_question_by_id("q2").published)
+        self.assertFalse(Qb.question_keeper.get_question_by_id("q1").published)
+        self.assertEqual(["New questions:\n(q2): What is two plus two?\n"], self.get_announcements("New questions"))
+
+        # Published questions aren't announced again after another restart
+        self.restart()
+        self.wait(60)
+        self.send(message("D00000001", "publish q1"))
+        self.assertEqual(2, len(self.get_announcements("New questions")))
+
+    def test_publishing_now_replaces_the_schedule(self):
+        self.send(message("D00000001", "publish q1 in 1h"), message("D00000001", "publish q1"))
+
+        self.wait(60 * 60)
+        self.assertEqual(["New questions:\n(q1): What is one plus one?\n"], self.get_announcements("New questions"))
+
+    def test_unclear_times_are_refused(self):
+        for time_spec in ["at 25", "at 13pm", "in soon", "in", "at noon"]:
+            self.send(message("D00000001", "publish q1 " + time_spec))
+            self.assertTrue(self.web_api.get_posts()[-1][1].startswith("I couldn't tell when"), time_spec)
+        self.assertFalse(Qb.question_keeper.get_question_by_id("q1").scheduled_publish_time)
+
+
+class AutoExpiryTest(ScheduledTestCase):
+    def setUp(self):
+        super().setUp()
+        self.send(message("D00000001", "question q1 What is one plus one? : two"),
+                  message("D00000001", "question q2 What is two plus two? : four"),
+                  message("D00000001", "publish q1"))
+
+    def test_expires_once_after_lifetime(self):
+        self.send(message("D00000002", "answer q1 two", user="U00000002"))
+
+        self.wait(Qb.QUESTION_LIFETIME - 1)
+        self.assertIsNotNone(Qb.question_keeper.get_question_by_id("q1"))
+        self.assertEqual([], self.get_announcements("The following questions have expired"))
+
+        self.wait(1)
+        self.wait(60)
+        self.restart()
+        self.wait(60)
+
+        announcements = self.get_announcements("The following questions have expired")
+        self.assertEqual(1, len(announcements))
+        self.assertIn("What is one plus one?", announcements[0])
+        self.assertIn("U00000002", announcements[0])
+        self.assertNotIn("What is two plus two?", announcements[0])
+        self.assertIsNone(Qb.question_keeper.get_question_by_id("q1"))
+        # Unpublished questions don't expire
+        self.assertIsNotNone(Qb.question_keeper.get_question_by_id("q2"))
+        self.assertEqual(["q1"], [q_json["qID"] for q_json in Qb.question_keeper.storage.read_history()])
+
+    def test_questions_due_together_are_one_announcement(self):
+        self.wait(60)
+        self.send(message("D00000001", "publish q2"))
+
+        self.wait(Qb.QUESTION_LIFETIME)
+
+        announcements = self.get_announcements("The following questions have expired")
+        self.assertEqual(1, len(announcements))
+        self.assertIn("What is one plus one?", announcements[0])
+        self.assertIn("What is two plus two?", announcements[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,206 @@
+import csv
+import random
+import unittest
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+import ScoreKeeper as Sk
+import WellBehavedSlackClient as Wbsc
+from tests.fake_slack import FakeSlackTestCase
+
+
+class ScoreKeeperTestCase(FakeSlackTestCase):
+    """Runs each test on a calendar it controls, starting with no scores saved"""
+
+    def setUp(self):
+        super().setUp()
+        self.slack_client = Wbsc.WellBehavedSlackClient("xoxb-test", async_outbound=False)
+        self.today = date(2026, 1, 30)
+        self.enter_context(mock.patch.object(Sk, "get_current_date", lambda: self.today))
+
+    # A keeper starting up, as the bot does after a restart
+    def start_keeper(self) -> Sk.ScoreKeeper:
+        keeper = Sk.ScoreKeeper(self.slack_client)
+        self.addCleanup(keeper.ledger_writer.flush)
+        return keeper
+
+    def move_to(self, keeper: Sk.ScoreKeeper, day: date):
+        self.today = day
+        keeper.next_rollover = 0
+        keeper.roll_over_if_due()
+
+    def get_announcements(self) -> list:
+        return [text for channel, text in self.web_api.get_posts() if text.startswith("Winners from")]
+
+
+class LedgerTest(ScoreKeeperTestCase):
+    def test_ledger_replays_to_the_same_scores(self):
+        keeper = self.start_keeper()
+        keeper.add_new_user("U1")
+        keeper.add_name_to_user("U1", "one")
+        keeper.add_new_user("U2")
+        keeper.add_name_to_user("U2", "two")
+        keeper.add_user_points("U1", 3)
+        self.move_to(keeper, date(2026, 1, 31))
+        keeper.add_user_point("U2")
+        keeper.add_user_point("U1")
+        keeper.ledger_writer.flush()
+
+        restarted = self.start_keeper()
+        self.assertEqual(keeper.dates, restarted.dates)
+        self.assertEqual(keeper.rows, restarted.rows)
+        self.assertEqual(keeper.totals, restarted.totals)
+        self.assertEqual(keeper.user_names, restarted.user_names)
+        self.assertEqual(keeper.get_total_scores_ranked(), restarted.get_total_scores_ranked())
+        self.assertEqual(keeper.get_today_scores_ranked(), restarted.get_today_scores_ranked())
+
+
+class RolloverTest(ScoreKeeperTestCase):
+    def setUp(self):
+        super().setUp()
+        self.keeper = self.start_keeper()
+        self.keeper.add_new_user("U1")
+        self.keeper.add_name_to_user("U1", "one")
+        self.keeper.add_user_points("U1", 2)
+
+    def test_new_day_starts_an_empty_today_row(self):
+        self.move_to(self.keeper, date(2026, 1, 31))
+
+        self.assertEqual("01/31/2026", self.keeper.dates[self.keeper.today_row_num])
+        self.assertEqual("No new scores from today.\n", self.keeper.get_today_scores_ranked())
+        self.assertEqual(2, self.keeper.totals[0])
+        self.assertEqual([], self.get_announcements())
+
+    def test_new_month_announces_winners_and_resets_totals(self):
+        self.move_to(self.keeper, date(2026, 2, 1))
+
+        self.assertEqual(["Winners from January!\n1: one - 2\n"], self.get_announcements())
+        self.assertEqual(0, self.keeper.totals[0])
+        # Skipped days still get rows
+        self.assertEqual(["01/30/2026", "01/31/2026", "02/01/2026"], self.keeper.dates)
+
+    def test_winners_are_announced_once_across_restarts(self):
+        self.move_to(self.keeper, date(2026, 2, 1))
+        self.keeper.ledger_writer.flush()
+
+        for day in [date(2026, 2, 1), date(2026, 2, 1), date(2026, 2, 3)]:
+            self.today = day
+            restarted = self.start_keeper()
+            restarted.ledger_writer.flush()
+            self.assertEqual(day.strftime(Sk.DATE_FORMAT), restarted.dates[restarted.today_row_num])
+            self.assertEqual(0, restarted.totals[0])
+
+        self.assertEqual(1, len(self.get_announcements()))
+
+
+class ScoreSheetMigrationTest(ScoreKeeperTestCase):
+    def write_score_sheet(self, rows: list):
+        with open(Sk.SCORES_FILE_NAME, "w", newline="") as scores_file:
+            csv.writer(scores_file).writerows([["", "U1", "U2"], ["", "one", "two"], ["", "0", "0"]] + rows)
+
+    def test_score_sheet_becomes_the_ledger(self):
+        self.write_score_sheet([["01/29/2026", "1", ""], ["01/30/2026", "", "4"]])
+
+        keeper = self.start_keeper()
+
+        self.assertEqual(["one", "two"], keeper.user_names)
+        self.assertEqual(["01/29/2026", "01/30/2026"], keeper.dates)
+        self.assertEqual([1, 4], keeper.totals.tolist())
+
+    def test_trailing_days_without_points_are_kept(self):
+        # The last day anyone got points was in January, but the sheet had already moved on to February
+        self.write_score_sheet([["01/30/2026", "1", "2"], ["01/31/2026", "", ""], ["02/01/2026", "", ""]])
+        self.today = date(2026, 2, 2)
+
+        keeper = self.start_keeper()
+
+        self.assertEqual("02/02/2026", keeper.dates[-1])
+        self.assertEqual(4, len(keeper.dates))
+        self.assertEqual([0, 0], keeper.totals.tolist())
+        self.assertEqual([], self.get_announcements())
+
+
+class RangeTest(ScoreKeeperTestCase):
+    """Range totals come from the running sums, so they're checked against adding up the days one by one"""
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(3)
+        self.today = date(2025, 12, 20)
+        self.keeper = self.start_keeper()
+        users = ["U1", "U2", "U3"]
+        for user_id in users:
+            self.keeper.add_new_user(user_id)
+            self.keeper.add_name_to_user(user_id, user_id.lower())
+
+        # Ends on a Thursday in March, so "week", "month", "last-month" and "year" all cover different days
+        while self.today < date(2026, 3, 19):
+            for _ in range(rng.randrange(4)):
+                self.keeper.add_user_points(rng.choice(users), rng.randrange(1, 4))
+            self.move_to(self.keeper, self.today + timedelta(days=1))
+        self.keeper.add_user_point("U1")
+
+    def add_up_days(self, start: date, end: date) -> list:
+        totals = [0] * len(self.keeper.user_ids)
+        for date_string, row in zip(self.keeper.dates, self.keeper.rows):
+            if start <= datetime.strptime(date_string, Sk.DATE_FORMAT).date() <= end:
+                for column, score in enumerate(row):
+                    if score != Sk.EMPTY_CELL:
+                        totals[column] += score
+        return totals
+
+    def assert_range_matches(self, range_spec: str, expected_start: date, expected_end: date):
+        start, end, description = self.keeper.get_date_range(range_spec)
+        self.assertEqual((expected_start, expected_end), (start, end), range_spec)
+        self.assertEqual(self.add_up_days(start, end), self.keeper.get_range_totals(start, end).tolist(), range_spec)
+
+    def test_named_ranges(self):
+        self.assert_range_matches("week", date(2026, 3, 16), date(2026, 3, 19))
+        self.assert_range_matches("month", date(2026, 3, 1), date(2026, 3, 19))
+        self.assert_range_matches("last-month", date(2026, 2, 1), date(2026, 2, 28))
+        self.assert_range_matches("year", date(2026, 1, 1), date(2026, 3, 19))
+        self.assert_range_matches("all", date.min, date(2026, 3, 19))
+        self.assertEqual("February", self.keeper.get_date_range("last-month")[2])
+
+    def test_month_range_matches_monthly_totals(self):
+        start, end, description = self.keeper.get_date_range("month")
+        self.assertEqual(self.keeper.totals.tolist(), self.keeper.get_range_totals(start, end).tolist())
+
+    def test_explicit_ranges(self):
+        self.assert_range_matches("1/1/2026..1/31/2026", date(2026, 1, 1), date(2026, 1, 31))
+        self.assert_range_matches("03/19/2026..03/19/2026", date(2026, 3, 19), date(2026, 3, 19))
+        # Days before the first row or after today have no points
+        self.assert_range_matches("1/1/2020..1/1/2030", date(2020, 1, 1), date(2030, 1, 1))
+        self.assert_range_matches("12/1/2025..12/20/2025", date(2025, 12, 1), date(2025, 12, 20))
+
+    def test_every_range_of_days(self):
+        days = [datetime.strptime(date_string, Sk.DATE_FORMAT).date() for date_string in self.keeper.dates]
+        for start in days[::7]:
+            for end in days[::5]:
+                self.assertEqual(self.add_up_days(start, end), self.keeper.get_range_totals(start, end).tolist(),
+                                 str(start) + ".." + str(end))
+
+    def test_reversed_range_is_empty(self):
+        start, end, description = self.keeper.get_date_range("3/1/2026..2/1/2026")
+        self.assertEqual([0, 0, 0], self.keeper.get_range_totals(start, end).tolist())
+        self.assertEqual("No scores from " + description + ".\n",
+                         self.keeper.get_range_scores_ranked(start, end, description))
+
+    def test_invalid_ranges(self):
+        for range_spec in ["", "fortnight", "1/1/2026..", "..1/1/2026", "2026-01-01..2026-01-31",
+                           "13/1/2026..1/2/2026"]:
+            self.assertIsNone(self.keeper.get_date_range(range_spec), range_spec)
+
+    def test_ranked_range_scores(self):
+        start, end, description = self.keeper.get_date_range("last-month")
+        totals = self.add_up_days(start, end)
+        expected = sorted([(points, self.keeper.user_names[column]) for column, points in enumerate(totals) if points],
+                          reverse=True)
+        self.assertEqual("*Scores from February*:\n" + Sk.Leaderboard.format_ranking(expected) + "\n",
+                         self.keeper.get_range_scores_ranked(start, end, description))
+        self.assertEqual({self.keeper.user_ids[column]: points for column, points in enumerate(totals) if points},
+                         self.keeper.get_points_between(start, end))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+import QOTDBot as Qb
+import WellBehavedSlackClient as Wbsc
+from tests.fake_slack import FakeSlackTestCase
+
+
+def rate_limited(retry_after: str) -> dict:
+    return {"ok": False, "error": "ratelimited", "headers": {"Retry-After": retry_after}}
+
+
+class SlackClientTestCase(FakeSlackTestCase):
+    """Runs each test with sleeping recorded instead of done, and no rate limits at all"""
+
+    def setUp(self):
+        super().setUp()
+        self.sleeps = []
+        self.enter_context(mock.patch("time.sleep", self.sleeps.append))
+        self.enter_context(mock.patch.object(Wbsc, "METHOD_RATE_LIMITS", {}))
+        self.enter_context(mock.patch.object(Wbsc, "DEFAULT_RATE_LIMIT", (1000.0, 1000)))
+
+        self.client = Wbsc.WellBehavedSlackClient("xoxb-test", async_outbound=False)
+
+
+class RetryTest(SlackClientTestCase):
+    def test_waits_as_long_as_retry_after_says(self):
+        self.web_api.queue("users.list", rate_limited("7"), rate_limited("2.5"))
+
+        result = self.client.api_call("users.list")
+
+        self.assertTrue(result["ok"])
+        self.assertEqual(3, len(self.web_api.get_calls("users.list")))
+        self.assertEqual([7.0, 2.5], self.sleeps)
+
+    def test_backs_off_without_retry_after(self):
+        self.web_api.queue("users.list", ConnectionError("down"), {"ok": False, "error": "ratelimited"})
+
+        result = self.client.api_call("users.list")
+
+        self.assertTrue(result["ok"])
+        self.assertEqual(2, len(self.sleeps))
+        for attempt, sleep in enumerate(self.sleeps):
+            self.assertLessEqual(sleep, min(Wbsc.API_BACKOFF_MAX, Wbsc.API_BACKOFF_BASE * 2 ** attempt))
+
+    def test_gives_up_after_retry_budget(self):
+        self.web_api.queue("users.list", *[ConnectionError("down")] * (Wbsc.API_RETRY_BUDGET + 1))
+
+        result = self.client.api_call("users.list")
+
+        self.assertEqual({"ok": False, "error": "connection_error"}, result)
+        self.assertEqual(Wbsc.API_RETRY_BUDGET, len(self.web_api.get_calls("users.list")))
+        self.assertEqual(Wbsc.API_RETRY_BUDGET - 1, len(self.sleeps))
+
+    def test_still_rate_limited_after_retry_budget(self):
+        self.web_api.queue("users.list", *[rate_limited("1")] * Wbsc.API_RETRY_BUDGET)
+
+        result = self.client.api_call("users.list")
+
+        self.assertEqual("ratelimited", result["error"])
+        self.assertEqual(Wbsc.API_RETRY_BUDGET, len(self.web_api.get_calls("users.list")))
+
+    def test_error_responses_are_not_retried(self):
+        self.web_api.queue("users.info", {"ok": False, "error": "user_not_found"})
+
+        self.assertEqual("user_not_found", self.client.api_call("users.info", user="U1")["error"])
+        self.assertEqual(1, len(self.web_api.calls))
+        self.assertEqual([], self.sleeps)
+
+
+class CircuitBreakerTest(SlackClientTestCase):
+    def fail_calls(self, num_calls: int):
+        for _ in range(num_calls):
+            self.web_api.queue("users.list", *[ConnectionError("down")] * Wbsc.API_RETRY_BUDGET)
+            self.client.api_call("users.list")
+
+    def test_opens_after_enough_failed_calls(self):
+        self.fail_calls(Wbsc.CIRCUIT_FAILURE_THRESHOLD - 1)
+        self.assertFalse(self.client.circuit_breaker.is_open())
+
+        self.fail_calls(1)
+        self.assertTrue(self.client.circuit_breaker.is_open())
+
+        # While open, calls fail without reaching Slack at all
+        num_calls = len(self.web_api.calls)
+        self.assertEqual({"ok": False, "error": "circuit_open"}, self.client.api_call("users.list"))
+        self.assertEqual(num_calls, len(self.web_api.calls))
+
+    def test_success_resets_the_failure_count(self):
+        self.fail_calls(Wbsc.CIRCUIT_FAILURE_THRESHOLD - 1)
+        self.client.api_call("users.list")
+        self.fail_calls(Wbsc.CIRCUIT_FAILURE_THRESHOLD - 1)
+
+        self.assertFalse(self.client.circuit_breaker.is_open())
+
+    def test_half_opens_after_reset_timeout(self):
+        self.fail_calls(Wbsc.CIRCUIT_FAILURE_THRESHOLD)
+        breaker = self.client.circuit_breaker
+
+        # Once the timeout is up, one trial call gets through, and others are held back while it's out
+        breaker.open_until = time.time() - 1
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        # A failed trial opens the breaker for another full timeout
+        breaker.record_failure()
+        self.assertGreater(breaker.open_until, time.time() + Wbsc.CIRCUIT_RESET_TIMEOUT - 5)
+        self.assertEqual("circuit_open", self.client.api_call("users.list")["error"])
+
+        # A successful trial closes it again
+        breaker.open_until = time.time() - 1
+        self.web_api.queue("users.list", ConnectionError("down"))  # Retried within the trial call
+        self.assertTrue(self.client.api_call("users.list")["ok"])
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(self.client.api_call("users.list")["ok"])
+
+
+class CallerTest(SlackClientTestCase):
+    """Callers of api_call check whether it worked rather than assuming it did"""
+
+    def setUp(self):
+        super().setUp()
+        Qb.slack_client = self.client
+
+    def test_startup_waits_for_auth_test(self):
+        self.web_api.queue("auth.test", {"ok": False, "error": "service_unavailable"},
+                           *[ConnectionError("down")] * Wbsc.API_RETRY_BUDGET)
+
+        self.assertEqual("UBOT", Qb.get_bot_id_from_slack())
+        self.assertEqual(2, self.sleeps.count(Wbsc.AUTH_RETRY_DELAY))
+
+    def test_startup_fails_clearly_on_a_bad_token(self):
+        self.web_api.queue("auth.test", {"ok": False, "error": "invalid_auth"})
+
+        with self.assertRaisesRegex(ConnectionError, "invalid_auth"):
+            Qb.get_bot_id_from_slack()
+
+    def test_refresh_user_list_reports_failure(self):
+        self.web_api.queue("users.list", *[ConnectionError("down")] * Wbsc.API_RETRY_BUDGET)
+
+        Qb.refresh_user_list("D1", Qb.DEVELOPER_ID, "", "1")
+
+        self.assertFalse(os.path.exists(Wbsc.USER_LIST_FILE))
+        posts = self.web_api.get_posts()
+        self.assertEqual(1, len(posts))
+        self.assertIn("connection_error", posts[0][1])
+
+    def test_refresh_user_list(self):
+        self.web_api.queue("users.list", {"ok": True, "members": [
+            {"id": "U1", "profile": {"display_name": "", "real_name": "Real Name"}},
+            {"id": "U2", "profile": {"display_name": "display", "real_name": "Other Name"}}
+        ]})
+
+        Qb.refresh_user_list("D1", Qb.DEVELOPER_ID, "", "1")
+
+        with open(Wbsc.USER_LIST_FILE) as users_file:
+            self.assertEqual({"U1": "Real Name", "U2": "display"}, json.load(users_file))
+        self.assertEqual("display", self.client.get_name_by_id("U2"))
+
+
+if __name__ == "__main__":
+    unittest.main()
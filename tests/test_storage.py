@@ -0,0 +1,79 @@
+import os
+import json
+import unittest
+from unittest import mock
+
+import MigrateStorage
+from Storage import FileStorage, SqliteStorage
+from tests.fake_slack import FakeSlackTestCase
+
+
+# Questions as the bot used to save them, with their attribute names as keys
+def make_legacy_question(q_id: str, expire_time: float) -> dict:
+    return {"q_id": q_id, "user_id": "U1", "question_text": "What is " + q_id + "?", "correct_answers": ["yes"],
+            "category": "", "init_time": expire_time - 200, "publish_time": expire_time - 100,
+            "expire_time": expire_time, "published": True, "just_published": False, "answered_by": ["U2"],
+            "guesses": {}}
+
+
+def make_legacy_poll(p_id: str) -> dict:
+    return {"user_id": "U1", "p_id": p_id, "poll_question_text": "Which " + p_id + "?",
+            "options": {"1": "This", "2": "That"}, "responses": {"U2": "1"}, "published": True,
+            "just_published": False}
+
+
+class MigrationTest(FakeSlackTestCase):
+    def setUp(self):
+        super().setUp()
+        with open("questions.json", "w") as file:
+            json.dump({"questions": [make_legacy_question("active", 0)]}, file)
+        with open("questionsHistory.json", "w") as file:
+            json.dump({"oldQuestions": [make_legacy_question("newer", 1600000000),
+                                        make_legacy_question("older", 1500000000)]}, file)
+        with open("polls.json", "w") as file:
+            json.dump({"polls": [make_legacy_poll("first"), make_legacy_poll("second")]}, file)
+
+    def test_legacy_question_files_migrate(self):
+        MigrateStorage.migrate_files_to_sqlite("qotd.db")
+
+        storage = SqliteStorage("qotd.db")
+        self.assertEqual(["active"], [q_json["qID"] for q_json in storage.load_questions()])
+        old_questions = storage.read_history()
+        self.assertEqual(["newer", "older"], [q_json["qID"] for q_json in old_questions])
+        self.assertEqual(["yes"], old_questions[0]["correctAnswers"])
+        self.assertEqual(1600000000, old_questions[0]["expireTime"])
+        storage.close()
+
+    def test_legacy_polls_file_migrates(self):
+        MigrateStorage.migrate_files_to_sqlite("qotd.db")
+
+        storage = SqliteStorage("qotd.db")
+        polls = storage.load_polls()
+        self.assertEqual(["first", "second"], [p_json["pID"] for p_json in polls])
+        self.assertEqual("Which first?", polls[0]["pollQuestionText"])
+        self.assertFalse(polls[0]["justPublished"])
+        storage.close()
+
+    def test_history_can_be_read_before_questions_are_loaded(self):
+        self.assertEqual(["newer", "older"], [q_json["qID"] for q_json in FileStorage().read_history()])
+
+    def test_failed_migration_leaves_nothing_behind(self):
+        with mock.patch.object(SqliteStorage, "save_polls", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                MigrateStorage.migrate_files_to_sqlite("qotd.db")
+        self.assertFalse([file_name for file_name in os.listdir() if file_name.startswith("qotd.db")])
+
+        # So trying again works
+        MigrateStorage.migrate_files_to_sqlite("qotd.db")
+        storage = SqliteStorage("qotd.db")
+        self.assertTrue(storage.has_data())
+        storage.close()
+
+    def test_refuses_a_database_with_data(self):
+        MigrateStorage.migrate_files_to_sqlite("qotd.db")
+        with self.assertRaises(ValueError):
+            MigrateStorage.migrate_files_to_sqlite("qotd.db")
+
+
+if __name__ == "__main__":
+    unittest.main()